@@ -1,22 +1,25 @@
 """Telegram bot handlers for n8n Updater."""
 
 import asyncio
-import functools
 import logging
+import os
 import time
 from datetime import datetime, timedelta
-from typing import TYPE_CHECKING
+from typing import Optional, TYPE_CHECKING
 
-from aiogram import Router, F
+from aiogram import BaseMiddleware, Router, F
 from aiogram.types import Message, CallbackQuery
-from aiogram.filters import Command, CommandStart
+from aiogram.filters import Command, CommandStart, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-from ..storage import get_storage, Server
-from ..version_checker import get_latest_version, compare_versions
-from ..ssh_executor import SSHExecutor, get_server_status, UpdateResult, RollbackResult, perform_full_health_check, check_n8n_health
+from ..storage import get_storage, Server, Storage
+from ..version_checker import cached_latest_version, parse_version
+from ..ssh_executor import SSHExecutor, cached_server_status, UpdateResult, RollbackResult, perform_full_health_check, check_n8n_health
 from .keyboards import (
+    ServerCB,
+    HistoryCB,
+    RollbackCB,
     get_main_menu,
     get_servers_menu,
     get_servers_list_keyboard,
@@ -40,6 +43,8 @@ from .keyboards import (
     get_status_keyboard,
 )
 
+from .middlewares import last_edit_hash, text_digest
+
 if TYPE_CHECKING:
     from ..scheduler import UpdateScheduler
 
@@ -50,6 +55,17 @@ router = Router()
 # Global reference to scheduler (set in main.py)
 _scheduler: "UpdateScheduler | None" = None
 
+# Storage handle, memoized once: handlers touch storage on every update,
+# so skip the accessor indirection on the hot path
+_storage_handle: Storage | None = None
+
+
+def _storage() -> Storage:
+    global _storage_handle
+    if _storage_handle is None:
+        _storage_handle = get_storage()
+    return _storage_handle
+
 
 def set_scheduler(scheduler: "UpdateScheduler"):
     """Set the global scheduler reference."""
@@ -85,9 +101,209 @@ class ServerEditStates(StatesGroup):
     waiting_url = State()
 
 
+# Cap parallel SSH update sessions started from the update flow
+# (tunable for large fleets, like N8N_SSH_CONCURRENCY for probes)
+_update_semaphore = asyncio.Semaphore(int(os.getenv("N8N_UPDATE_CONCURRENCY", "4")))
+
+# In-flight background tasks (connection probes etc.), tracked so
+# shutdown can cancel and await them instead of abandoning SSH sessions
+_background_tasks: set[asyncio.Task] = set()
+
+
+def _spawn_background(coro) -> asyncio.Task:
+    """Create a background task tracked for graceful shutdown."""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+async def _safe_delete(message: Message):
+    """Delete a message, ignoring failures (already gone, no rights)."""
+    try:
+        await message.delete()
+    except Exception:
+        pass
+
+
+async def cancel_background_tasks():
+    """Cancel tracked background tasks and wait for them (on shutdown)."""
+    if not _background_tasks:
+        return
+    for task in _background_tasks:
+        task.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+
+
+async def _gather_limited(coros, limit: int = 8, per_task_timeout: float = 20.0) -> list:
+    """
+    Run coroutines with bounded concurrency and a per-task timeout.
+
+    Results come back in input order; a failed or timed-out coroutine
+    yields its exception instead of sinking the whole batch.
+    """
+    sem = asyncio.Semaphore(limit)
+
+    async def run(coro):
+        async with sem:
+            try:
+                return await asyncio.wait_for(coro, per_task_timeout)
+            except Exception as e:
+                return e
+
+    return await asyncio.gather(*(run(coro) for coro in coros))
+
+async def _edit_if_changed(message: Message, text: str, reply_markup=None):
+    """Edit a message only when the rendered text actually changed.
+
+    The comparison uses the per-message digests recorded by
+    EditTrackingMiddleware, so skipping is safe even if another handler
+    edited the message in between.
+    """
+    key = (message.chat.id, message.message_id)
+    _cancel_pending_edit(key)
+    if last_edit_hash.get(key) == text_digest(text):
+        return
+    await message.edit_text(text, reply_markup=reply_markup)
+
+
+# Pending coalesced text edits keyed by (chat_id, message_id). Interim
+# "spinner" edits wait out a short window first, so when the real render
+# lands quickly (cache hits) the throwaway edit never reaches Telegram.
+_pending_edits: dict[tuple[int, int], asyncio.Task] = {}
+
+
+def _cancel_pending_edit(key: tuple[int, int]):
+    """Drop a scheduled coalesced edit for this message, if any."""
+    task = _pending_edits.pop(key, None)
+    if task:
+        task.cancel()
+
+
+async def _edit_text_later(message: Message, text: str, reply_markup, delay: float):
+    """Edit message text after a short debounce window."""
+    key = (message.chat.id, message.message_id)
+    try:
+        await asyncio.sleep(delay)
+        await message.edit_text(text, reply_markup=reply_markup)
+    except Exception:
+        pass  # Superseded or message gone
+    finally:
+        if _pending_edits.get(key) is asyncio.current_task():
+            del _pending_edits[key]
+
+
+def _edit_text_coalesced(message: Message, text: str, reply_markup=None, delay: float = 0.3):
+    """Schedule a debounced edit_text, replacing any pending one.
+
+    Used for transient progress texts: the final render goes through
+    _edit_if_changed, which cancels anything still pending here.
+    """
+    key = (message.chat.id, message.message_id)
+    _cancel_pending_edit(key)
+    _pending_edits[key] = asyncio.create_task(
+        _edit_text_later(message, text, reply_markup, delay)
+    )
+
+
+# Schedule options: time_key -> (offset from now, description label).
+# "night" is special-cased in cb_schedule (next 3:00 AM, not an offset).
+_SCHEDULE_OFFSETS: dict[str, tuple[timedelta, str]] = {
+    "now": (timedelta(0), "сейчас"),
+    "5m": (timedelta(minutes=5), "через 5 минут"),
+    "15m": (timedelta(minutes=15), "через 15 минут"),
+    "30m": (timedelta(minutes=30), "через 30 минут"),
+    "1h": (timedelta(hours=1), "через 1 час"),
+    "3h": (timedelta(hours=3), "через 3 часа"),
+}
+
+
+# Badge lookup tables for the status render loops: indexed selection
+# instead of an if/elif ladder per server
+_RUN_BADGE = ("🔴", "🟢")  # indexed by bool
+_CMP_BADGE = {-1: " ⬆️", 0: " ✅", 1: ""}  # keyed by comparison sign
+
+
+# Message templates hoisted to module scope: handlers fill in the dynamic
+# fields instead of reassembling the full Markdown string on every call
+_SERVER_DETAILS_TMPL = (
+    "🖥 *{name}*\n\n"
+    "**Хост:** `{host}:{port}`\n"
+    "**Пользователь:** `{user}`\n"
+    "**Авторизация:** {auth_info}\n"
+    "**Путь n8n:** `{n8n_path}`{url_info}"
+)
+
+_TEST_OK_TMPL = (
+    "✅ *Подключение успешно!*\n\n"
+    "**Сервер:** {name}\n"
+    "**Статус n8n:** {status}\n"
+    "**Версия:** {version}"
+)
+
+_TEST_FAIL_TMPL = (
+    "❌ *Ошибка подключения*\n\n"
+    "**Сервер:** {name}\n"
+    "**Ошибка:** {error}"
+)
+
+_SERVER_ADDED_TMPL = (
+    "✅ *Сервер добавлен успешно!*\n\n"
+    "**Имя:** {name}\n"
+    "**Хост:** {host}:{port}\n"
+    "**Статус n8n:** {status}\n"
+    "**Версия:** {version}"
+)
+
+_SERVER_ADDED_FAIL_TMPL = (
+    "⚠️ *Сервер добавлен, но подключение не удалось*\n\n"
+    "**Имя:** {name}\n"
+    "**Ошибка:** {error}\n\n"
+    "Проверь настройки и попробуй подключиться позже."
+)
+
+_HISTORY_HEADER = "📜 *История обновлений*\n"
+
+_HISTORY_ROW_TMPL = (
+    "{status} `{date}`\n"
+    "   └ {server_name} {version_info}"
+)
+
+_SERVER_HISTORY_ROW_TMPL = (
+    "{status} `{date}` {version_info}\n"
+    "   └ {message}"
+)
+
+_SETTINGS_TMPL = (
+    "⚙️ *Настройки*\n\n"
+    "**Интервал проверки обновлений:** {interval} ч\n"
+    "**Мониторинг серверов:** {monitoring}\n"
+    "**Подробный вывод:** {verbose}"
+)
+
+_MONITORING_TMPL = (
+    "🩺 *Мониторинг серверов*\n\n"
+    "**Статус:** {status}\n\n"
+    "Когда мониторинг включён, бот каждые 5 минут проверяет:\n"
+    "• SSH подключение к серверам\n"
+    "• Работу контейнера n8n\n"
+    "• Доступность UI (если настроен URL)\n\n"
+    "При проблемах бот отправит уведомление."
+)
+
+_VERBOSE_TMPL = (
+    "📝 *Подробный вывод*\n\n"
+    "**Статус:** {status}\n\n"
+    "Когда включён, при обновлении показывается:\n"
+    "• Текущий шаг (бэкап → pull → restart)\n"
+    "• Таймер с начала процесса\n"
+    "• Детальный прогресс по шагам"
+)
+
+
 def is_admin(user_id: int) -> bool:
     """Check if user is admin."""
-    storage = get_storage()
+    storage = _storage()
     admin_id = storage.get_admin_chat_id()
     # If no admin set, anyone can be admin (first user becomes admin)
     if admin_id is None:
@@ -95,19 +311,33 @@ def is_admin(user_id: int) -> bool:
     return user_id == admin_id
 
 
-def admin_only(handler):
-    """Decorator to restrict handler to admin only."""
-    @functools.wraps(handler)
-    async def wrapper(event: Message | CallbackQuery, **kwargs):
+class AdminMiddleware(BaseMiddleware):
+    """Reject updates from non-admins before they reach any handler.
+
+    Replaces the per-handler admin_only decorator: the check now runs
+    once per update instead of once per wrapped handler frame, and
+    non-admin traffic short-circuits without touching routing at all.
+    /start and /help stay open so the first user can claim the bot.
+    """
+
+    _OPEN_COMMANDS = ("/start", "/help")
+
+    async def __call__(self, handler, event: Message | CallbackQuery, data: dict):
+        if isinstance(event, Message) and (event.text or "").startswith(self._OPEN_COMMANDS):
+            return await handler(event, data)
+
         user_id = event.from_user.id if event.from_user else 0
-        if not is_admin(user_id):
-            if isinstance(event, Message):
-                await event.answer("⛔ Доступ запрещён. Вы не являетесь администратором.")
-            else:
-                await event.answer("⛔ Доступ запрещён", show_alert=True)
-            return
-        return await handler(event, **kwargs)
-    return wrapper
+        if is_admin(user_id):
+            return await handler(event, data)
+
+        if isinstance(event, Message):
+            await event.answer("⛔ Доступ запрещён. Вы не являетесь администратором.")
+        else:
+            await event.answer("⛔ Доступ запрещён", show_alert=True)
+
+
+router.message.outer_middleware(AdminMiddleware())
+router.callback_query.outer_middleware(AdminMiddleware())
 
 
 # ============= Command Handlers =============
@@ -118,7 +348,7 @@ async def cmd_start(message: Message):
     user_id = message.from_user.id if message.from_user else 0
     user_name = message.from_user.full_name if message.from_user else "Unknown"
     
-    storage = get_storage()
+    storage = _storage()
     admin_id = storage.get_admin_chat_id()
     
     # First user becomes admin
@@ -158,33 +388,28 @@ async def cmd_start(message: Message):
 
 
 @router.message(Command("status"))
-@admin_only
 async def cmd_status(message: Message):
     """Handle /status command - show server statuses."""
     await show_status(message)
 
 
 @router.message(Command("check"))
-@admin_only
 async def cmd_check(message: Message):
     """Handle /check command - check for updates."""
     await check_updates(message)
 
 
 @router.message(Command("update"))
-@admin_only
 async def cmd_update(message: Message, state: FSMContext):
     """Handle /update command - start update flow."""
     await start_update_flow(message, state)
 
 
 @router.message(Command("servers"))
-@admin_only
 async def cmd_servers(message: Message):
     """Handle /servers command - manage servers."""
     await message.answer(
         "🖥 *Управление серверами*",
-        parse_mode="Markdown",
         reply_markup=get_servers_menu()
     )
 
@@ -200,7 +425,6 @@ async def cmd_help(message: Message):
         "/update - Обновить серверы\n"
         "/servers - Управление серверами\n"
         "/help - Эта справка\n",
-        parse_mode="Markdown",
         reply_markup=get_back_keyboard()
     )
 
@@ -208,16 +432,14 @@ async def cmd_help(message: Message):
 # ============= Main Menu Callbacks =============
 
 @router.callback_query(F.data == "menu")
-@admin_only
 async def cb_menu(callback: CallbackQuery, state: FSMContext):
     """Return to main menu."""
     await state.clear()
-    storage = get_storage()
+    storage = _storage()
     has_servers = storage.server_count() > 0
     
     await callback.message.edit_text(
         "🏠 *Главное меню*\n\nВыберите действие:",
-        parse_mode="Markdown",
         reply_markup=get_main_menu(has_servers=has_servers)
     )
     await callback.answer()
@@ -235,7 +457,6 @@ async def cb_cancel(callback: CallbackQuery, state: FSMContext):
 
 
 @router.callback_query(F.data == "status")
-@admin_only
 async def cb_status(callback: CallbackQuery):
     """Show cached server statuses."""
     await callback.answer()
@@ -243,58 +464,67 @@ async def cb_status(callback: CallbackQuery):
 
 
 @router.callback_query(F.data == "refresh_all")
-@admin_only
 async def cb_refresh_all(callback: CallbackQuery):
     """Run live health check and version check."""
     await callback.answer("Обновляю данные...")
-    await callback.message.edit_text("🔄 Обновляю данные...\n\n• Проверяю серверы...\n• Проверяю версию n8n...")
+    _edit_text_coalesced(callback.message, "🔄 Обновляю данные...\n\n• Проверяю серверы...\n• Проверяю версию n8n...")
     
-    storage = get_storage()
+    storage = _storage()
     servers = storage.get_all_servers()
     
-    # Run health checks and version check in parallel
-    health_tasks = [perform_full_health_check(server) for server in servers]
-    version_task = get_latest_version()
-    
-    # Execute all tasks
-    all_results = await asyncio.gather(version_task, *health_tasks, return_exceptions=True)
-    
-    latest_version = all_results[0] if not isinstance(all_results[0], Exception) else None
-    health_results = all_results[1:]
-    
-    # Save health results
-    for i, result in enumerate(health_results):
-        if isinstance(result, Exception):
-            storage.update_server_health(
-                server_id=servers[i].id,
-                server_name=servers[i].name,
+    # Version check runs alongside the health checks; the health fan-out
+    # is bounded and per-task-timeboxed so one dead server can't stall
+    # the whole refresh
+    version_task = asyncio.create_task(cached_latest_version())
+    health_results = await _gather_limited(
+        [perform_full_health_check(server) for server in servers],
+        limit=min(8, len(servers)),
+        per_task_timeout=20,
+    )
+    try:
+        latest_version = await version_task
+    except Exception:
+        latest_version = None
+
+    # Save all health results and the check timestamps in one transaction
+    health_rows = []
+    for server, result in zip(servers, health_results):
+        if isinstance(result, asyncio.TimeoutError):
+            health_rows.append(dict(
+                server_id=server.id,
+                server_name=server.name,
+                is_healthy=False,
+                error_message="Таймаут проверки (20 сек)"
+            ))
+        elif isinstance(result, Exception):
+            health_rows.append(dict(
+                server_id=server.id,
+                server_name=server.name,
                 is_healthy=False,
                 error_message=str(result)
-            )
+            ))
         else:
-            storage.update_server_health(
-                server_id=servers[i].id,
-                server_name=servers[i].name,
+            health_rows.append(dict(
+                server_id=server.id,
+                server_name=server.name,
                 is_healthy=result.is_healthy,
                 error_message=result.error,
                 ssh_ok=result.ssh_ok,
                 container_running=result.container_running,
                 ui_accessible=result.ui_accessible,
                 version=result.version
-            )
-    
-    # Save version check time
-    from datetime import datetime
-    storage.set_setting("last_version_check", datetime.now().isoformat())
+            ))
+
+    settings = {"last_version_check": datetime.now().isoformat()}
     if latest_version:
-        storage.set_last_known_version(str(latest_version))
-    
-    # Show updated status
-    await show_status(callback.message, edit=True)
+        settings["last_known_version"] = str(latest_version)
+    storage.update_server_health_bulk(health_rows, settings=settings)
+
+    # Show updated status (reusing the list fetched above)
+    await show_status(callback.message, edit=True, servers=servers)
 
 
 @router.callback_query(F.data == "check")
-@admin_only
 async def cb_check(callback: CallbackQuery):
     """Legacy: redirect to status."""
     await callback.answer()
@@ -302,7 +532,6 @@ async def cb_check(callback: CallbackQuery):
 
 
 @router.callback_query(F.data == "update_menu")
-@admin_only
 async def cb_update_menu(callback: CallbackQuery, state: FSMContext):
     """Start update flow."""
     await callback.answer()
@@ -312,46 +541,40 @@ async def cb_update_menu(callback: CallbackQuery, state: FSMContext):
 # ============= Server Management Callbacks =============
 
 @router.callback_query(F.data == "servers_menu")
-@admin_only
 async def cb_servers_menu(callback: CallbackQuery, state: FSMContext):
     """Show servers management menu."""
     await state.clear()
     await callback.message.edit_text(
         "🖥 *Управление серверами*\n\nВыберите действие:",
-        parse_mode="Markdown",
         reply_markup=get_servers_menu()
     )
     await callback.answer()
 
 
 @router.callback_query(F.data == "list_servers")
-@admin_only
 async def cb_list_servers(callback: CallbackQuery):
     """List all servers."""
-    storage = get_storage()
+    storage = _storage()
     servers = storage.get_all_servers()
     
     if not servers:
         await callback.message.edit_text(
             "📋 *Список серверов*\n\nУ тебя пока нет серверов.",
-            parse_mode="Markdown",
             reply_markup=get_servers_menu()
         )
     else:
         await callback.message.edit_text(
             f"📋 *Список серверов* ({len(servers)})\n\nВыбери сервер для управления:",
-            parse_mode="Markdown",
             reply_markup=get_servers_list_keyboard(servers)
         )
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("server_details:"))
-@admin_only
-async def cb_server_details(callback: CallbackQuery):
+@router.callback_query(ServerCB.filter(F.action == "details"))
+async def cb_server_details(callback: CallbackQuery, callback_data: ServerCB):
     """Show server details."""
-    server_id = int(callback.data.split(":")[1])
-    storage = get_storage()
+    server_id = callback_data.server_id
+    storage = _storage()
     server = storage.get_server(server_id)
     
     if not server:
@@ -362,23 +585,25 @@ async def cb_server_details(callback: CallbackQuery):
     url_info = f"\n**URL:** `{server.n8n_url}`" if server.n8n_url else "\n**URL:** не настроен"
     
     await callback.message.edit_text(
-        f"🖥 *{server.name}*\n\n"
-        f"**Хост:** `{server.host}:{server.port}`\n"
-        f"**Пользователь:** `{server.user}`\n"
-        f"**Авторизация:** {auth_info}\n"
-        f"**Путь n8n:** `{server.n8n_path}`{url_info}",
-        parse_mode="Markdown",
+        _SERVER_DETAILS_TMPL.format(
+            name=server.name,
+            host=server.host,
+            port=server.port,
+            user=server.user,
+            auth_info=auth_info,
+            n8n_path=server.n8n_path,
+            url_info=url_info
+        ),
         reply_markup=get_server_details_keyboard(server_id, has_url=bool(server.n8n_url))
     )
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("test_server:"))
-@admin_only
-async def cb_test_server(callback: CallbackQuery):
+@router.callback_query(ServerCB.filter(F.action == "test"))
+async def cb_test_server(callback: CallbackQuery, callback_data: ServerCB):
     """Test server connection."""
-    server_id = int(callback.data.split(":")[1])
-    storage = get_storage()
+    server_id = callback_data.server_id
+    storage = _storage()
     server = storage.get_server(server_id)
     
     if not server:
@@ -386,47 +611,55 @@ async def cb_test_server(callback: CallbackQuery):
         return
     
     await callback.answer("Проверяю подключение...")
-    
-    await callback.message.edit_text(
-        f"🔄 Проверяю подключение к {server.name}...",
-        parse_mode="Markdown"
-    )
-    
+
+    _edit_text_coalesced(callback.message, f"🔄 Проверяю подключение к {server.name}...")
+
+    # SSH probes take seconds; run them in a background task so the
+    # handler returns immediately and doesn't block the dispatcher
+    _spawn_background(_test_server_probe(callback.message, server))
+
+
+async def _test_server_probe(message: Message, server: Server):
+    """Run connection probes for a server and edit the result into place."""
     executor = SSHExecutor(server)
-    success, message = await executor.test_connection()
-    
+    try:
+        success, error = await executor.test_connection()
+
+        if success:
+            # Also check n8n on the same connection (probes are independent)
+            version, running = await asyncio.gather(
+                executor.get_current_version(),
+                executor.check_n8n_running()
+            )
+    finally:
+        executor._release()
+
     if success:
-        # Also check n8n
-        version = await executor.get_current_version()
-        running = await executor.check_n8n_running()
-        
         status_emoji = "🟢" if running else "🔴"
         version_text = f"v{version}" if version else "неизвестна"
-        
-        await callback.message.edit_text(
-            f"✅ *Подключение успешно!*\n\n"
-            f"**Сервер:** {server.name}\n"
-            f"**Статус n8n:** {status_emoji} {'Работает' if running else 'Не запущен'}\n"
-            f"**Версия:** {version_text}",
-            parse_mode="Markdown",
-            reply_markup=get_server_details_keyboard(server_id)
+
+        await _edit_if_changed(
+            message,
+            _TEST_OK_TMPL.format(
+                name=server.name,
+                status=f"{status_emoji} {'Работает' if running else 'Не запущен'}",
+                version=version_text
+            ),
+            reply_markup=get_server_details_keyboard(server.id)
         )
     else:
-        await callback.message.edit_text(
-            f"❌ *Ошибка подключения*\n\n"
-            f"**Сервер:** {server.name}\n"
-            f"**Ошибка:** {message}",
-            parse_mode="Markdown",
-            reply_markup=get_server_details_keyboard(server_id)
+        await _edit_if_changed(
+            message,
+            _TEST_FAIL_TMPL.format(name=server.name, error=error),
+            reply_markup=get_server_details_keyboard(server.id)
         )
 
 
-@router.callback_query(F.data.startswith("delete_server:"))
-@admin_only
-async def cb_delete_server(callback: CallbackQuery):
+@router.callback_query(ServerCB.filter(F.action == "delete"))
+async def cb_delete_server(callback: CallbackQuery, callback_data: ServerCB):
     """Confirm server deletion."""
-    server_id = int(callback.data.split(":")[1])
-    storage = get_storage()
+    server_id = callback_data.server_id
+    storage = _storage()
     server = storage.get_server(server_id)
     
     if not server:
@@ -437,25 +670,22 @@ async def cb_delete_server(callback: CallbackQuery):
         f"⚠️ *Удаление сервера*\n\n"
         f"Ты уверен, что хочешь удалить **{server.name}**?\n\n"
         f"Это действие нельзя отменить.",
-        parse_mode="Markdown",
         reply_markup=get_confirm_delete_keyboard(server_id)
     )
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("confirm_delete:"))
-@admin_only
-async def cb_confirm_delete(callback: CallbackQuery):
+@router.callback_query(ServerCB.filter(F.action == "confirm_delete"))
+async def cb_confirm_delete(callback: CallbackQuery, callback_data: ServerCB):
     """Execute server deletion."""
-    server_id = int(callback.data.split(":")[1])
-    storage = get_storage()
+    server_id = callback_data.server_id
+    storage = _storage()
     server = storage.get_server(server_id)
     
     if server:
         storage.delete_server(server_id)
         await callback.message.edit_text(
             f"✅ Сервер **{server.name}** удалён.",
-            parse_mode="Markdown",
             reply_markup=get_back_keyboard()
         )
     else:
@@ -465,62 +695,154 @@ async def cb_confirm_delete(callback: CallbackQuery):
 # ============= Add Server Flow =============
 
 @router.callback_query(F.data == "add_server")
-@admin_only
 async def cb_add_server(callback: CallbackQuery, state: FSMContext):
     """Start add server flow."""
     await state.set_state(AddServerStates.waiting_name)
     await callback.message.edit_text(
         "➕ *Добавление сервера*\n\n"
         "Шаг 1/6: Введи имя сервера (например: Production, Staging):",
-        parse_mode="Markdown",
         reply_markup=get_cancel_keyboard()
     )
     await callback.answer()
 
 
-@router.message(AddServerStates.waiting_name)
-async def process_server_name(message: Message, state: FSMContext):
-    """Process server name input."""
-    name = message.text.strip()
-    
-    if len(name) < 2:
-        await message.answer("Имя должно быть не менее 2 символов. Попробуй ещё раз:")
+# Step table for the add-server wizard: one message handler walks this
+# instead of seven near-identical per-state handlers. Each step validates
+# the input, stores it, and prompts for the next field.
+
+def _validate_name(text: str):
+    if len(text) < 2:
+        return False, "Имя должно быть не менее 2 символов. Попробуй ещё раз:"
+    # Names travel inside callback_data ("sel:<name>"), which Telegram
+    # caps at 64 bytes; keep a safety margin for the prefix
+    if len(text.encode()) > 48:
+        return False, "Имя слишком длинное (максимум 48 байт). Введи короче:"
+    # Names are interpolated into Markdown messages everywhere; reject
+    # control characters that would break every later render
+    if any(ch in text for ch in "*_`["):
+        return False, "Имя не должно содержать символы * _ ` [. Введи другое имя:"
+    if _storage().get_server_by_name(text):
+        return False, "Сервер с таким именем уже существует. Введи другое имя:"
+    return True, text
+
+
+def _validate_host(text: str):
+    if not text:
+        return False, "Введи корректный IP-адрес или hostname:"
+    return True, text
+
+
+def _validate_port(text: str):
+    try:
+        port = int(text)
+        if port < 1 or port > 65535:
+            raise ValueError()
+    except ValueError:
+        return False, "Введи корректный номер порта (1-65535):"
+    return True, port
+
+
+def _validate_user(text: str):
+    if not text:
+        return False, "Введи имя пользователя:"
+    return True, text
+
+
+def _validate_password(text: str):
+    if not text:
+        return False, "Введи пароль:"
+    return True, text
+
+
+def _validate_abs_path(text: str):
+    if not text.startswith("/"):
+        return False, "Путь должен быть абсолютным (начинаться с /):"
+    return True, text
+
+
+_N8N_PATH_PROMPT = (
+    "Шаг 6/6: Введи путь к папке с docker-compose n8n\n"
+    "(или пропусти для `/opt/n8n-docker-caddy`):"
+)
+
+_ADD_STEPS = {
+    AddServerStates.waiting_name.state: {
+        "validate": _validate_name,
+        "data": lambda v: {"name": v},
+        "next": AddServerStates.waiting_host,
+        "prompt": lambda v: f"✅ Имя: **{v}**\n\nШаг 2/6: Введи IP-адрес или hostname сервера:",
+        "markup": get_cancel_keyboard,
+    },
+    AddServerStates.waiting_host.state: {
+        "validate": _validate_host,
+        "data": lambda v: {"host": v},
+        "next": AddServerStates.waiting_port,
+        "prompt": lambda v: f"✅ Хост: **{v}**\n\nШаг 3/6: Введи SSH порт (или пропусти для порта 22):",
+        "markup": lambda: get_skip_keyboard("port"),
+    },
+    AddServerStates.waiting_port.state: {
+        "validate": _validate_port,
+        "data": lambda v: {"port": v},
+        "next": AddServerStates.waiting_user,
+        "prompt": lambda v: f"✅ Порт: **{v}**\n\nШаг 4/6: Введи имя пользователя SSH (или пропусти для root):",
+        "markup": lambda: get_skip_keyboard("user"),
+    },
+    AddServerStates.waiting_user.state: {
+        "validate": _validate_user,
+        "data": lambda v: {"user": v},
+        "next": AddServerStates.waiting_auth_type,
+        "prompt": lambda v: f"✅ Пользователь: **{v}**\n\nШаг 5/6: Выбери способ авторизации:",
+        "markup": get_auth_type_keyboard,
+    },
+    AddServerStates.waiting_password.state: {
+        "secret": True,
+        "validate": _validate_password,
+        "data": lambda v: {"ssh_password": v, "ssh_key_path": None},
+        "next": AddServerStates.waiting_n8n_path,
+        "prompt": lambda v: f"✅ Пароль сохранён\n\n{_N8N_PATH_PROMPT}",
+        "markup": lambda: get_skip_keyboard("n8n_path"),
+    },
+    AddServerStates.waiting_key_path.state: {
+        "validate": _validate_abs_path,
+        "data": lambda v: {"ssh_key_path": v, "ssh_password": None},
+        "next": AddServerStates.waiting_n8n_path,
+        "prompt": lambda v: f"✅ SSH ключ: `{v}`\n\n{_N8N_PATH_PROMPT}",
+        "markup": lambda: get_skip_keyboard("n8n_path"),
+    },
+    AddServerStates.waiting_n8n_path.state: {
+        "validate": _validate_abs_path,
+        "data": lambda v: {"n8n_path": v},
+        "final": True,
+    },
+}
+
+
+@router.message(StateFilter(AddServerStates))
+async def process_add_server_step(message: Message, state: FSMContext):
+    """Handle one text input of the add-server wizard via the step table."""
+    step = _ADD_STEPS.get(await state.get_state())
+    if step is None:
+        # waiting_auth_type expects a button press, not text
         return
-    
-    storage = get_storage()
-    if storage.get_server_by_name(name):
-        await message.answer("Сервер с таким именем уже существует. Введи другое имя:")
+
+    if step.get("secret"):
+        # Delete the message with password for security; fire-and-forget
+        # so the next prompt isn't held up by the delete round-trip
+        _spawn_background(_safe_delete(message))
+
+    ok, value = step["validate"]((message.text or "").strip())
+    if not ok:
+        await message.answer(value)
         return
-    
-    await state.update_data(name=name)
-    await state.set_state(AddServerStates.waiting_host)
-    
-    await message.answer(
-        f"✅ Имя: **{name}**\n\n"
-        "Шаг 2/6: Введи IP-адрес или hostname сервера:",
-        parse_mode="Markdown",
-        reply_markup=get_cancel_keyboard()
-    )
 
+    await state.update_data(**step["data"](value))
 
-@router.message(AddServerStates.waiting_host)
-async def process_server_host(message: Message, state: FSMContext):
-    """Process server host input."""
-    host = message.text.strip()
-    
-    if not host:
-        await message.answer("Введи корректный IP-адрес или hostname:")
+    if step.get("final"):
+        await finish_add_server(message, state)
         return
-    
-    await state.update_data(host=host)
-    await state.set_state(AddServerStates.waiting_port)
-    
-    await message.answer(
-        f"✅ Хост: **{host}**\n\n"
-        "Шаг 3/6: Введи SSH порт (или пропусти для порта 22):",
-        parse_mode="Markdown",
-        reply_markup=get_skip_keyboard("port")
-    )
+
+    await state.set_state(step["next"])
+    await message.answer(step["prompt"](value), reply_markup=step["markup"]())
 
 
 @router.callback_query(F.data == "skip:port", AddServerStates.waiting_port)
@@ -532,34 +854,11 @@ async def skip_port(callback: CallbackQuery, state: FSMContext):
     await callback.message.edit_text(
         "✅ Порт: **22** (по умолчанию)\n\n"
         "Шаг 4/6: Введи имя пользователя SSH (или пропусти для root):",
-        parse_mode="Markdown",
         reply_markup=get_skip_keyboard("user")
     )
     await callback.answer()
 
 
-@router.message(AddServerStates.waiting_port)
-async def process_server_port(message: Message, state: FSMContext):
-    """Process server port input."""
-    try:
-        port = int(message.text.strip())
-        if port < 1 or port > 65535:
-            raise ValueError()
-    except ValueError:
-        await message.answer("Введи корректный номер порта (1-65535):")
-        return
-    
-    await state.update_data(port=port)
-    await state.set_state(AddServerStates.waiting_user)
-    
-    await message.answer(
-        f"✅ Порт: **{port}**\n\n"
-        "Шаг 4/6: Введи имя пользователя SSH (или пропусти для root):",
-        parse_mode="Markdown",
-        reply_markup=get_skip_keyboard("user")
-    )
-
-
 @router.callback_query(F.data == "skip:user", AddServerStates.waiting_user)
 async def skip_user(callback: CallbackQuery, state: FSMContext):
     """Skip user, use default."""
@@ -569,33 +868,12 @@ async def skip_user(callback: CallbackQuery, state: FSMContext):
     await callback.message.edit_text(
         "✅ Пользователь: **root** (по умолчанию)\n\n"
         "Шаг 5/6: Выбери способ авторизации:",
-        parse_mode="Markdown",
         reply_markup=get_auth_type_keyboard()
     )
     await callback.answer()
 
 
-@router.message(AddServerStates.waiting_user)
-async def process_server_user(message: Message, state: FSMContext):
-    """Process server user input."""
-    user = message.text.strip()
-    
-    if not user:
-        await message.answer("Введи имя пользователя:")
-        return
-    
-    await state.update_data(user=user)
-    await state.set_state(AddServerStates.waiting_auth_type)
-    
-    await message.answer(
-        f"✅ Пользователь: **{user}**\n\n"
-        "Шаг 5/6: Выбери способ авторизации:",
-        parse_mode="Markdown",
-        reply_markup=get_auth_type_keyboard()
-    )
-
-
-@router.callback_query(F.data.startswith("auth_type:"), AddServerStates.waiting_auth_type)
+@router.callback_query(F.data.in_({"auth_type:password", "auth_type:key"}), AddServerStates.waiting_auth_type)
 async def process_auth_type(callback: CallbackQuery, state: FSMContext):
     """Process auth type selection."""
     auth_type = callback.data.split(":")[1]
@@ -606,7 +884,6 @@ async def process_auth_type(callback: CallbackQuery, state: FSMContext):
         await callback.message.edit_text(
             "✅ Авторизация: **пароль**\n\n"
             "Введи пароль SSH:",
-            parse_mode="Markdown",
             reply_markup=get_cancel_keyboard()
         )
     else:
@@ -615,60 +892,11 @@ async def process_auth_type(callback: CallbackQuery, state: FSMContext):
             "✅ Авторизация: **SSH ключ**\n\n"
             "Введи путь к SSH ключу на сервере где запущен этот бот\n"
             "(например: `/root/.ssh/id_rsa`):",
-            parse_mode="Markdown",
             reply_markup=get_cancel_keyboard()
         )
     await callback.answer()
 
 
-@router.message(AddServerStates.waiting_password)
-async def process_server_password(message: Message, state: FSMContext):
-    """Process server password input."""
-    password = message.text.strip()
-    
-    # Delete the message with password for security
-    try:
-        await message.delete()
-    except Exception:
-        pass
-    
-    if not password:
-        await message.answer("Введи пароль:")
-        return
-    
-    await state.update_data(ssh_password=password, ssh_key_path=None)
-    await state.set_state(AddServerStates.waiting_n8n_path)
-    
-    await message.answer(
-        "✅ Пароль сохранён\n\n"
-        "Шаг 6/6: Введи путь к папке с docker-compose n8n\n"
-        "(или пропусти для `/opt/n8n-docker-caddy`):",
-        parse_mode="Markdown",
-        reply_markup=get_skip_keyboard("n8n_path")
-    )
-
-
-@router.message(AddServerStates.waiting_key_path)
-async def process_key_path(message: Message, state: FSMContext):
-    """Process SSH key path input."""
-    key_path = message.text.strip()
-    
-    if not key_path.startswith("/"):
-        await message.answer("Путь должен быть абсолютным (начинаться с /):")
-        return
-    
-    await state.update_data(ssh_key_path=key_path, ssh_password=None)
-    await state.set_state(AddServerStates.waiting_n8n_path)
-    
-    await message.answer(
-        f"✅ SSH ключ: `{key_path}`\n\n"
-        "Шаг 6/6: Введи путь к папке с docker-compose n8n\n"
-        "(или пропусти для `/opt/n8n-docker-caddy`):",
-        parse_mode="Markdown",
-        reply_markup=get_skip_keyboard("n8n_path")
-    )
-
-
 @router.callback_query(F.data == "skip:n8n_path", AddServerStates.waiting_n8n_path)
 async def skip_n8n_path(callback: CallbackQuery, state: FSMContext):
     """Skip n8n path, use default."""
@@ -677,19 +905,6 @@ async def skip_n8n_path(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
-@router.message(AddServerStates.waiting_n8n_path)
-async def process_n8n_path(message: Message, state: FSMContext):
-    """Process n8n path input."""
-    n8n_path = message.text.strip()
-    
-    if not n8n_path.startswith("/"):
-        await message.answer("Путь должен быть абсолютным (начинаться с /):")
-        return
-    
-    await state.update_data(n8n_path=n8n_path)
-    await finish_add_server(message, state)
-
-
 async def finish_add_server(message: Message, state: FSMContext, edit: bool = False):
     """Finish adding server and save to database."""
     data = await state.get_data()
@@ -707,183 +922,184 @@ async def finish_add_server(message: Message, state: FSMContext, edit: bool = Fa
         n8n_path=data.get("n8n_path", "/opt/n8n-docker-caddy")
     )
     
-    storage = get_storage()
+    storage = _storage()
     server_id = storage.add_server(server)
     server.id = server_id
     
     # Test connection
     text = f"🔄 Сервер **{server.name}** добавлен. Проверяю подключение..."
     if edit:
-        await message.edit_text(text, parse_mode="Markdown")
+        _edit_text_coalesced(message, text)
     else:
-        message = await message.answer(text, parse_mode="Markdown")
+        message = await message.answer(text)
     
     executor = SSHExecutor(server)
-    success, conn_message = await executor.test_connection()
-    
+    try:
+        success, conn_message = await executor.test_connection()
+
+        if success:
+            # Independent probes: run them concurrently like cb_test_server
+            version, running = await asyncio.gather(
+                executor.get_current_version(),
+                executor.check_n8n_running()
+            )
+    finally:
+        executor._release()
+
     if success:
-        version = await executor.get_current_version()
-        running = await executor.check_n8n_running()
-        
         status = "🟢 Работает" if running else "🔴 Не запущен"
         version_text = f"v{version}" if version else "неизвестна"
         
-        await message.edit_text(
-            f"✅ *Сервер добавлен успешно!*\n\n"
-            f"**Имя:** {server.name}\n"
-            f"**Хост:** {server.host}:{server.port}\n"
-            f"**Статус n8n:** {status}\n"
-            f"**Версия:** {version_text}",
-            parse_mode="Markdown",
+        await _edit_if_changed(
+            message,
+            _SERVER_ADDED_TMPL.format(
+                name=server.name,
+                host=server.host,
+                port=server.port,
+                status=status,
+                version=version_text
+            ),
             reply_markup=get_main_menu(has_servers=True)
         )
     else:
-        await message.edit_text(
-            f"⚠️ *Сервер добавлен, но подключение не удалось*\n\n"
-            f"**Имя:** {server.name}\n"
-            f"**Ошибка:** {conn_message}\n\n"
-            "Проверь настройки и попробуй подключиться позже.",
-            parse_mode="Markdown",
+        await _edit_if_changed(
+            message,
+            _SERVER_ADDED_FAIL_TMPL.format(name=server.name, error=conn_message),
             reply_markup=get_server_details_keyboard(server_id)
         )
 
 
 # ============= Update History =============
 
+_STATUS_OK = "✅"
+_STATUS_FAIL = "❌"
+
+
+def _format_history_row(entry: dict, include_msg: bool = False) -> str:
+    """Render one update-history entry for the history views."""
+    date = entry["created_at_display"]
+    status = _STATUS_OK if entry["success"] else _STATUS_FAIL
+    version_info = ""
+    if entry["old_version"] and entry["new_version"]:
+        if entry["old_version"] != entry["new_version"]:
+            version_info = f"v{entry['old_version']} → v{entry['new_version']}"
+        else:
+            version_info = f"v{entry['new_version']}"
+    elif entry["new_version"]:
+        version_info = f"v{entry['new_version']}"
+
+    if include_msg:
+        return _SERVER_HISTORY_ROW_TMPL.format(
+            status=status, date=date, version_info=version_info,
+            message=entry.get("message", "")[:50]
+        )
+    return _HISTORY_ROW_TMPL.format(
+        status=status, date=date,
+        server_name=entry["server_name"], version_info=version_info
+    )
+
+
+# Rendered history pages keyed by (server_id, limit, newest row id):
+# repeated views and "load more" round-trips re-render nothing unless a
+# new history row has been written since
+_HISTORY_PAGE_CACHE_MAX = 16
+_history_page_cache: dict[tuple[int, int, int], tuple[Optional[str], bool]] = {}
+
+
+def _render_history_page(limit: int, server: Server = None) -> tuple[Optional[str], bool]:
+    """Render a history page as (text, has_more), with caching.
+
+    Returns (None, False) when there is no history to show.
+    """
+    storage = _storage()
+    key = (server.id if server else 0, limit, storage.get_max_history_id())
+    hit = _history_page_cache.get(key)
+    if hit is not None:
+        return hit
+
+    history = storage.get_update_history(limit=limit, server_id=server.id if server else None)
+    if not history:
+        result = (None, False)
+    elif server:
+        lines = [f"📜 *История: {server.name}*\n"]
+        lines.extend(_format_history_row(entry, include_msg=True) for entry in history)
+        lines.append("")
+        result = ("\n".join(lines), len(history) == limit)
+    else:
+        lines = [_HISTORY_HEADER]
+        lines.extend(_format_history_row(entry) for entry in history)
+        result = ("\n".join(lines), len(history) == limit)
+
+    if len(_history_page_cache) >= _HISTORY_PAGE_CACHE_MAX:
+        _history_page_cache.clear()
+    _history_page_cache[key] = result
+    return result
+
+
 @router.callback_query(F.data == "history")
-@admin_only
 async def cb_history(callback: CallbackQuery):
     """Show update history."""
-    storage = get_storage()
-    history = storage.get_update_history(limit=10)
-    
-    if not history:
+    text, has_more = _render_history_page(limit=10)
+
+    if text is None:
         await callback.message.edit_text(
             "📜 *История обновлений*\n\n"
             "История пуста. Обновлений ещё не было.",
-            parse_mode="Markdown",
             reply_markup=get_back_keyboard()
         )
         await callback.answer()
         return
-    
-    lines = ["📜 *История обновлений*\n"]
-    
-    for entry in history:
-        date = entry["created_at"][:16].replace("T", " ")
-        status = "✅" if entry["success"] else "❌"
-        version_info = ""
-        if entry["old_version"] and entry["new_version"]:
-            if entry["old_version"] != entry["new_version"]:
-                version_info = f"v{entry['old_version']} → v{entry['new_version']}"
-            else:
-                version_info = f"v{entry['new_version']}"
-        elif entry["new_version"]:
-            version_info = f"v{entry['new_version']}"
-        
-        lines.append(
-            f"{status} `{date}`\n"
-            f"   └ {entry['server_name']} {version_info}"
-        )
-    
-    has_more = len(history) == 10
-    
+
     await callback.message.edit_text(
-        "\n".join(lines),
-        parse_mode="Markdown",
+        text,
         reply_markup=get_history_keyboard(has_more=has_more, offset=10)
     )
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("history:more:"))
-@admin_only
-async def cb_history_more(callback: CallbackQuery):
+@router.callback_query(HistoryCB.filter(F.action == "more"))
+async def cb_history_more(callback: CallbackQuery, callback_data: HistoryCB):
     """Load more history entries."""
-    offset = int(callback.data.split(":")[2])
-    storage = get_storage()
-    history = storage.get_update_history(limit=10)
-    
-    # For simplicity, just show from beginning with higher limit
-    history = storage.get_update_history(limit=offset + 10)
-    
-    if not history:
+    offset = callback_data.offset
+
+    # The view re-renders the whole message, so fetch one page more each tap
+    text, has_more = _render_history_page(limit=offset + 10)
+
+    if text is None:
         await callback.answer("Больше записей нет")
         return
-    
-    lines = ["📜 *История обновлений*\n"]
-    
-    for entry in history:
-        date = entry["created_at"][:16].replace("T", " ")
-        status = "✅" if entry["success"] else "❌"
-        version_info = ""
-        if entry["old_version"] and entry["new_version"]:
-            if entry["old_version"] != entry["new_version"]:
-                version_info = f"v{entry['old_version']} → v{entry['new_version']}"
-            else:
-                version_info = f"v{entry['new_version']}"
-        elif entry["new_version"]:
-            version_info = f"v{entry['new_version']}"
-        
-        lines.append(
-            f"{status} `{date}`\n"
-            f"   └ {entry['server_name']} {version_info}"
-        )
-    
-    has_more = len(history) == offset + 10
-    
+
     await callback.message.edit_text(
-        "\n".join(lines),
-        parse_mode="Markdown",
+        text,
         reply_markup=get_history_keyboard(has_more=has_more, offset=offset + 10)
     )
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("server_history:"))
-@admin_only
-async def cb_server_history(callback: CallbackQuery):
+@router.callback_query(ServerCB.filter(F.action == "history"))
+async def cb_server_history(callback: CallbackQuery, callback_data: ServerCB):
     """Show history for a specific server."""
-    server_id = int(callback.data.split(":")[1])
-    storage = get_storage()
+    server_id = callback_data.server_id
+    storage = _storage()
     server = storage.get_server(server_id)
-    
+
     if not server:
         await callback.answer("Сервер не найден", show_alert=True)
         return
-    
-    history = storage.get_update_history(limit=10, server_id=server_id)
-    
-    if not history:
+
+    text, _ = _render_history_page(limit=10, server=server)
+
+    if text is None:
         await callback.message.edit_text(
             f"📜 *История обновлений: {server.name}*\n\n"
             "История пуста.",
-            parse_mode="Markdown",
             reply_markup=get_server_details_keyboard(server_id, has_url=bool(server.n8n_url))
         )
         await callback.answer()
         return
-    
-    lines = [f"📜 *История: {server.name}*\n"]
-    
-    for entry in history:
-        date = entry["created_at"][:16].replace("T", " ")
-        status = "✅" if entry["success"] else "❌"
-        version_info = ""
-        if entry["old_version"] and entry["new_version"]:
-            if entry["old_version"] != entry["new_version"]:
-                version_info = f"v{entry['old_version']} → v{entry['new_version']}"
-            else:
-                version_info = f"v{entry['new_version']}"
-        
-        msg = entry.get("message", "")[:50]
-        lines.append(f"{status} `{date}` {version_info}\n   └ {msg}")
-    
-    lines.append("")
-    
+
     await callback.message.edit_text(
-        "\n".join(lines),
-        parse_mode="Markdown",
+        text,
         reply_markup=get_server_details_keyboard(server_id, has_url=bool(server.n8n_url))
     )
     await callback.answer()
@@ -891,12 +1107,11 @@ async def cb_server_history(callback: CallbackQuery):
 
 # ============= Health Check =============
 
-@router.callback_query(F.data.startswith("health_check:"))
-@admin_only
-async def cb_health_check(callback: CallbackQuery):
+@router.callback_query(ServerCB.filter(F.action == "health"))
+async def cb_health_check(callback: CallbackQuery, callback_data: ServerCB):
     """Perform health check on a server."""
-    server_id = int(callback.data.split(":")[1])
-    storage = get_storage()
+    server_id = callback_data.server_id
+    storage = _storage()
     server = storage.get_server(server_id)
     
     if not server:
@@ -904,12 +1119,9 @@ async def cb_health_check(callback: CallbackQuery):
         return
     
     await callback.answer("Выполняю health check...")
-    
-    await callback.message.edit_text(
-        f"🩺 Проверяю здоровье *{server.name}*...",
-        parse_mode="Markdown"
-    )
-    
+
+    _edit_text_coalesced(callback.message, f"🩺 Проверяю здоровье *{server.name}*...")
+
     result = await perform_full_health_check(server)
     
     # Update health in database
@@ -944,22 +1156,21 @@ async def cb_health_check(callback: CallbackQuery):
     
     if result.error:
         text += f"\n**Ошибка:** {result.error}"
-    
-    await callback.message.edit_text(
+
+    await _edit_if_changed(
+        callback.message,
         text,
-        parse_mode="Markdown",
         reply_markup=get_server_details_keyboard(server_id, has_url=bool(server.n8n_url))
     )
 
 
 # ============= Server URL Configuration =============
 
-@router.callback_query(F.data.startswith("set_url:"))
-@admin_only
-async def cb_set_url(callback: CallbackQuery, state: FSMContext):
+@router.callback_query(ServerCB.filter(F.action == "set_url"))
+async def cb_set_url(callback: CallbackQuery, callback_data: ServerCB, state: FSMContext):
     """Start URL configuration for a server."""
-    server_id = int(callback.data.split(":")[1])
-    storage = get_storage()
+    server_id = callback_data.server_id
+    storage = _storage()
     server = storage.get_server(server_id)
     
     if not server:
@@ -976,7 +1187,6 @@ async def cb_set_url(callback: CallbackQuery, state: FSMContext):
         f"Введи URL твоего n8n (например: `https://n8n.example.com`).\n"
         f"Это нужно для проверки доступности UI.{current_url}\n\n"
         f"Или отправь `-` чтобы удалить URL.",
-        parse_mode="Markdown",
         reply_markup=get_cancel_keyboard()
     )
     await callback.answer()
@@ -993,7 +1203,7 @@ async def process_server_url(message: Message, state: FSMContext):
         await message.answer("Ошибка: сервер не найден", reply_markup=get_back_keyboard())
         return
     
-    storage = get_storage()
+    storage = _storage()
     server = storage.get_server(server_id)
     
     if not server:
@@ -1009,7 +1219,6 @@ async def process_server_url(message: Message, state: FSMContext):
         await state.clear()
         await message.answer(
             f"✅ URL для *{server.name}* удалён.",
-            parse_mode="Markdown",
             reply_markup=get_server_details_keyboard(server_id, has_url=False)
         )
         return
@@ -1033,7 +1242,6 @@ async def process_server_url(message: Message, state: FSMContext):
             f"**Сервер:** {server.name}\n"
             f"**URL:** `{url}`\n"
             f"**Статус:** 🟢 Доступен",
-            parse_mode="Markdown",
             reply_markup=get_server_details_keyboard(server_id, has_url=True)
         )
     else:
@@ -1043,7 +1251,6 @@ async def process_server_url(message: Message, state: FSMContext):
             f"**URL:** `{url}`\n"
             f"**Ошибка:** {error}\n\n"
             f"Возможно, URL правильный, но сервер временно недоступен.",
-            parse_mode="Markdown",
             reply_markup=get_server_details_keyboard(server_id, has_url=True)
         )
 
@@ -1051,10 +1258,9 @@ async def process_server_url(message: Message, state: FSMContext):
 # ============= Settings =============
 
 @router.callback_query(F.data == "settings_menu")
-@admin_only
 async def cb_settings_menu(callback: CallbackQuery):
     """Show settings menu."""
-    storage = get_storage()
+    storage = _storage()
     interval = storage.get_check_interval()
     monitoring_enabled = storage.get_setting("monitoring_enabled", "0") == "1"
     verbose_enabled = storage.get_verbose_updates()
@@ -1063,35 +1269,32 @@ async def cb_settings_menu(callback: CallbackQuery):
     verbose_status = "🟢 Включён" if verbose_enabled else "🔴 Выключен"
 
     await callback.message.edit_text(
-        f"⚙️ *Настройки*\n\n"
-        f"**Интервал проверки обновлений:** {interval} ч\n"
-        f"**Мониторинг серверов:** {monitoring_status}\n"
-        f"**Подробный вывод:** {verbose_status}",
-        parse_mode="Markdown",
+        _SETTINGS_TMPL.format(
+            interval=interval,
+            monitoring=monitoring_status,
+            verbose=verbose_status
+        ),
         reply_markup=get_settings_keyboard()
     )
     await callback.answer()
 
 
 @router.callback_query(F.data == "setting:interval")
-@admin_only
 async def cb_setting_interval(callback: CallbackQuery):
     """Show interval selection."""
     await callback.message.edit_text(
         "⏱ *Интервал проверки обновлений*\n\n"
         "Как часто проверять наличие новых версий n8n?",
-        parse_mode="Markdown",
         reply_markup=get_interval_keyboard()
     )
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("set_interval:"))
-@admin_only
+@router.callback_query(F.data.in_({f"set_interval:{h}" for h in (1, 3, 6, 12, 24)}))
 async def cb_set_interval(callback: CallbackQuery):
     """Set check interval."""
     hours = int(callback.data.split(":")[1])
-    storage = get_storage()
+    storage = _storage()
     storage.set_check_interval(hours)
     
     # Update scheduler if running
@@ -1100,41 +1303,31 @@ async def cb_set_interval(callback: CallbackQuery):
     
     await callback.message.edit_text(
         f"✅ Интервал проверки установлен: **{hours} ч**",
-        parse_mode="Markdown",
         reply_markup=get_back_keyboard()
     )
     await callback.answer()
 
 
 @router.callback_query(F.data == "setting:monitoring")
-@admin_only
 async def cb_setting_monitoring(callback: CallbackQuery):
     """Show monitoring settings."""
-    storage = get_storage()
+    storage = _storage()
     monitoring_enabled = storage.get_setting("monitoring_enabled", "0") == "1"
     
     status = "🟢 Включён" if monitoring_enabled else "🔴 Выключен"
     
     await callback.message.edit_text(
-        f"🩺 *Мониторинг серверов*\n\n"
-        f"**Статус:** {status}\n\n"
-        f"Когда мониторинг включён, бот каждые 5 минут проверяет:\n"
-        f"• SSH подключение к серверам\n"
-        f"• Работу контейнера n8n\n"
-        f"• Доступность UI (если настроен URL)\n\n"
-        f"При проблемах бот отправит уведомление.",
-        parse_mode="Markdown",
+        _MONITORING_TMPL.format(status=status),
         reply_markup=get_monitoring_keyboard(enabled=monitoring_enabled)
     )
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("monitoring:"))
-@admin_only
+@router.callback_query(F.data.in_({"monitoring:enable", "monitoring:disable"}))
 async def cb_toggle_monitoring(callback: CallbackQuery):
     """Toggle monitoring on/off."""
     action = callback.data.split(":")[1]
-    storage = get_storage()
+    storage = _storage()
     
     if action == "enable":
         storage.set_setting("monitoring_enabled", "1")
@@ -1147,7 +1340,6 @@ async def cb_toggle_monitoring(callback: CallbackQuery):
             "✅ *Мониторинг включён!*\n\n"
             "Бот будет проверять серверы каждые 5 минут и уведомлять о проблемах.\n\n"
             "Для проверки доступности UI не забудь настроить URL для каждого сервера.",
-            parse_mode="Markdown",
             reply_markup=get_back_keyboard()
         )
     else:
@@ -1159,7 +1351,6 @@ async def cb_toggle_monitoring(callback: CallbackQuery):
         
         await callback.message.edit_text(
             "🔴 *Мониторинг выключен*",
-            parse_mode="Markdown",
             reply_markup=get_back_keyboard()
         )
     
@@ -1169,47 +1360,37 @@ async def cb_toggle_monitoring(callback: CallbackQuery):
 # ============= Verbose Mode Handlers =============
 
 @router.callback_query(F.data == "setting:verbose")
-@admin_only
 async def cb_setting_verbose(callback: CallbackQuery):
     """Show verbose mode settings."""
-    storage = get_storage()
+    storage = _storage()
     verbose_enabled = storage.get_verbose_updates()
 
     status = "🟢 Включён" if verbose_enabled else "🔴 Выключен"
 
     await callback.message.edit_text(
-        f"📝 *Подробный вывод*\n\n"
-        f"**Статус:** {status}\n\n"
-        f"Когда включён, при обновлении показывается:\n"
-        f"• Текущий шаг (бэкап → pull → restart)\n"
-        f"• Таймер с начала процесса\n"
-        f"• Детальный прогресс по шагам",
-        parse_mode="Markdown",
+        _VERBOSE_TMPL.format(status=status),
         reply_markup=get_verbose_keyboard(enabled=verbose_enabled)
     )
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("verbose:"))
-@admin_only
+@router.callback_query(F.data.in_({"verbose:enable", "verbose:disable"}))
 async def cb_toggle_verbose(callback: CallbackQuery):
     """Toggle verbose mode on/off."""
     action = callback.data.split(":")[1]
-    storage = get_storage()
+    storage = _storage()
 
     if action == "enable":
         storage.set_verbose_updates(True)
         await callback.message.edit_text(
             "✅ *Подробный вывод включён!*\n\n"
             "Теперь при обновлении будет показываться детальный прогресс.",
-            parse_mode="Markdown",
             reply_markup=get_back_keyboard()
         )
     else:
         storage.set_verbose_updates(False)
         await callback.message.edit_text(
             "🔴 *Подробный вывод выключен*",
-            parse_mode="Markdown",
             reply_markup=get_back_keyboard()
         )
 
@@ -1218,16 +1399,13 @@ async def cb_toggle_verbose(callback: CallbackQuery):
 
 # ============= Rollback Handlers =============
 
-@router.callback_query(F.data.startswith("rollback_confirm:"))
-@admin_only
-async def cb_rollback_confirm(callback: CallbackQuery):
+@router.callback_query(RollbackCB.filter(F.action == "confirm"))
+async def cb_rollback_confirm(callback: CallbackQuery, callback_data: RollbackCB):
     """Confirm and execute rollback."""
-    parts = callback.data.split(":")
-    server_id = int(parts[1])
-    backup_id = int(parts[2])
-    
-    storage = get_storage()
-    server = storage.get_server(server_id)
+    backup_id = callback_data.backup_id
+
+    storage = _storage()
+    server = storage.get_server(callback_data.server_id)
     backup = storage.get_backup(backup_id)
     
     if not server:
@@ -1244,7 +1422,6 @@ async def cb_rollback_confirm(callback: CallbackQuery):
         f"⏪ *Откат {server.name}*\n\n"
         f"Восстанавливаю версию {backup.get('old_version', 'unknown')}...\n"
         "Это может занять несколько минут.",
-        parse_mode="Markdown"
     )
     
     # Execute rollback
@@ -1263,7 +1440,6 @@ async def cb_rollback_confirm(callback: CallbackQuery):
             f"**Сервер:** {server.name}\n"
             f"**Восстановленная версия:** v{result.restored_version or 'unknown'}\n\n"
             f"Сервер работает.",
-            parse_mode="Markdown",
             reply_markup=get_rollback_result_keyboard()
         )
     else:
@@ -1272,21 +1448,15 @@ async def cb_rollback_confirm(callback: CallbackQuery):
             f"**Сервер:** {server.name}\n"
             f"**Ошибка:** {result.message}\n\n"
             f"Детали: {result.details[:200] if result.details else 'нет'}",
-            parse_mode="Markdown",
             reply_markup=get_rollback_result_keyboard()
         )
 
 
-@router.callback_query(F.data.startswith("rollback_skip:"))
-@admin_only
-async def cb_rollback_skip(callback: CallbackQuery):
+@router.callback_query(RollbackCB.filter(F.action == "skip"))
+async def cb_rollback_skip(callback: CallbackQuery, callback_data: RollbackCB):
     """Skip rollback, leave server as is."""
-    parts = callback.data.split(":")
-    server_id = int(parts[1])
-    backup_id = int(parts[2])
-    
-    storage = get_storage()
-    server = storage.get_server(server_id)
+    storage = _storage()
+    server = storage.get_server(callback_data.server_id)
     
     server_name = server.name if server else "Сервер"
     
@@ -1294,7 +1464,6 @@ async def cb_rollback_skip(callback: CallbackQuery):
         f"ℹ️ *Откат отменён*\n\n"
         f"**{server_name}** оставлен в текущем состоянии.\n\n"
         f"Бэкап сохранён, можешь откатить позже вручную.",
-        parse_mode="Markdown",
         reply_markup=get_back_keyboard()
     )
     await callback.answer()
@@ -1302,61 +1471,98 @@ async def cb_rollback_skip(callback: CallbackQuery):
 
 # ============= Update Flow =============
 
-@router.callback_query(F.data.startswith("select_server:"))
-@admin_only
+# Pending keyboard redraws keyed by (chat_id, message_id). Rapid toggles
+# cancel the previous redraw so only the latest markup hits the API.
+_pending_redraws: dict[tuple[int, int], asyncio.Task] = {}
+
+
+async def _redraw_markup_later(message: Message, markup, delay: float):
+    """Edit reply markup after a short debounce window."""
+    key = (message.chat.id, message.message_id)
+    try:
+        await asyncio.sleep(delay)
+        await message.edit_reply_markup(reply_markup=markup)
+    except Exception:
+        pass  # Superseded, markup unchanged, or message gone
+    finally:
+        if _pending_redraws.get(key) is asyncio.current_task():
+            del _pending_redraws[key]
+
+
+def _schedule_markup_redraw(message: Message, markup, delay: float = 0.15):
+    """Schedule a debounced edit_reply_markup, replacing any pending one."""
+    key = (message.chat.id, message.message_id)
+    existing = _pending_redraws.get(key)
+    if existing:
+        existing.cancel()
+    _pending_redraws[key] = asyncio.create_task(
+        _redraw_markup_later(message, markup, delay)
+    )
+
+
+@router.callback_query(F.data.startswith("sel:"))
 async def cb_select_server(callback: CallbackQuery, state: FSMContext):
     """Handle server selection."""
-    storage = get_storage()
-    servers = storage.get_all_servers()
     server_name = callback.data.split(":", 1)[1]
-    
-    # Get current selection
+
+    # Work off the snapshot taken in start_update_flow; only hit storage
+    # again if the snapshot is missing or stale (>30s selection session)
     data = await state.get_data()
-    selected: set[str] = set(data.get("selected_servers", []))
-    
+    servers: list[Server] = data.get("servers_snapshot") or []
+    if not servers or time.monotonic() - data.get("snapshot_at", 0.0) > 30:
+        servers = _storage().get_all_servers()
+        await state.update_data(servers_snapshot=servers, snapshot_at=time.monotonic())
+
+    # Current selection is a bitmask over server ids: one int in FSM
+    # instead of (de)serializing a list of names on every click.
+    mask: int = data.get("sel_mask", 0)
+    full_mask = 0
+    for s in servers:
+        full_mask |= 1 << s.id
+
     if server_name == "__all__":
         # Toggle all servers
-        all_names = {s.name for s in servers}
-        if selected == all_names:
-            selected.clear()
-        else:
-            selected = all_names
+        mask = 0 if mask == full_mask else full_mask
     elif server_name == "__confirm__":
         # Proceed to time selection
-        if not selected:
+        selected_names = [s.name for s in servers if mask & (1 << s.id)]
+        if not selected_names:
             await callback.answer("Выбери хотя бы один сервер", show_alert=True)
             return
-        
-        await state.update_data(selected_servers=list(selected))
+
+        # servers come sorted by name, so selected_names is already
+        # sorted; join the display string once here — the later steps
+        # reuse it instead of re-joining per screen
+        servers_text = ", ".join(selected_names)
+        await state.update_data(selected_servers=selected_names, selected_text=servers_text)
         await state.set_state(UpdateStates.selecting_time)
-        
-        servers_text = ", ".join(sorted(selected))
         await callback.message.edit_text(
             f"📅 *Выбор времени обновления*\n\n"
             f"Серверы: {servers_text}\n\n"
             "Когда выполнить обновление?",
-            parse_mode="Markdown",
             reply_markup=get_time_keyboard("selected")
         )
         await callback.answer()
         return
     else:
         # Toggle single server
-        if server_name in selected:
-            selected.discard(server_name)
-        else:
-            selected.add(server_name)
-    
-    await state.update_data(selected_servers=list(selected))
-    
-    await callback.message.edit_reply_markup(
-        reply_markup=get_servers_keyboard(servers, "select_server", selected)
+        server = next((s for s in servers if s.name == server_name), None)
+        if server is None:
+            await callback.answer("Сервер не найден", show_alert=True)
+            return
+        mask ^= 1 << server.id
+
+    await state.update_data(sel_mask=mask)
+    selected = {s.name for s in servers if mask & (1 << s.id)}
+
+    _schedule_markup_redraw(
+        callback.message,
+        get_servers_keyboard(servers, "sel", selected)
     )
     await callback.answer()
 
 
 @router.callback_query(F.data.startswith("schedule:"))
-@admin_only
 async def cb_schedule(callback: CallbackQuery, state: FSMContext):
     """Handle time selection for update."""
     parts = callback.data.split(":")
@@ -1371,38 +1577,28 @@ async def cb_schedule(callback: CallbackQuery, state: FSMContext):
     
     # Calculate schedule time
     now = datetime.now()
-    schedule_time = None
-    time_description = ""
-    
-    if time_key == "now":
-        schedule_time = now
-        time_description = "сейчас"
-    elif time_key == "5m":
-        schedule_time = now + timedelta(minutes=5)
-        time_description = f"через 5 минут ({schedule_time.strftime('%H:%M')})"
-    elif time_key == "15m":
-        schedule_time = now + timedelta(minutes=15)
-        time_description = f"через 15 минут ({schedule_time.strftime('%H:%M')})"
-    elif time_key == "30m":
-        schedule_time = now + timedelta(minutes=30)
-        time_description = f"через 30 минут ({schedule_time.strftime('%H:%M')})"
-    elif time_key == "1h":
-        schedule_time = now + timedelta(hours=1)
-        time_description = f"через 1 час ({schedule_time.strftime('%H:%M')})"
-    elif time_key == "3h":
-        schedule_time = now + timedelta(hours=3)
-        time_description = f"через 3 часа ({schedule_time.strftime('%H:%M')})"
-    elif time_key == "night":
+
+    if time_key == "night":
         # Schedule for 3:00 AM
         schedule_time = now.replace(hour=3, minute=0, second=0, microsecond=0)
         if schedule_time <= now:
             schedule_time += timedelta(days=1)
         time_description = f"ночью в 3:00 ({schedule_time.strftime('%d.%m %H:%M')})"
-    
+    elif time_key in _SCHEDULE_OFFSETS:
+        delta, label = _SCHEDULE_OFFSETS[time_key]
+        schedule_time = now + delta
+        if time_key == "now":
+            time_description = label
+        else:
+            time_description = f"{label} ({schedule_time.strftime('%H:%M')})"
+    else:
+        await callback.answer("Неизвестный вариант времени", show_alert=True)
+        return
+
     await state.update_data(schedule_time=schedule_time.isoformat(), time_description=time_description)
-    
-    servers_text = ", ".join(sorted(selected_servers))
-    
+
+    servers_text = data.get("selected_text") or ", ".join(selected_servers)
+
     if time_key == "now":
         # Execute immediately
         await callback.answer()
@@ -1415,14 +1611,12 @@ async def cb_schedule(callback: CallbackQuery, state: FSMContext):
             f"Серверы: {servers_text}\n"
             f"Время: {time_description}\n\n"
             "Подтвердить?",
-            parse_mode="Markdown",
             reply_markup=get_confirm_update_keyboard("selected", time_key)
         )
         await callback.answer()
 
 
 @router.callback_query(F.data.startswith("confirm_update:"))
-@admin_only
 async def cb_confirm_update(callback: CallbackQuery, state: FSMContext):
     """Confirm scheduled update."""
     data = await state.get_data()
@@ -1445,16 +1639,14 @@ async def cb_confirm_update(callback: CallbackQuery, state: FSMContext):
             chat_id=callback.message.chat.id
         )
         
+        servers_text = data.get("selected_text") or ", ".join(selected_servers)
         await state.clear()
-        
-        servers_text = ", ".join(sorted(selected_servers))
         await callback.message.edit_text(
             f"✅ *Обновление запланировано*\n\n"
             f"Серверы: {servers_text}\n"
             f"Время: {time_description}\n"
             f"ID задачи: `{job_id}`\n\n"
             "Я уведомлю тебя о результате.",
-            parse_mode="Markdown",
             reply_markup=get_back_keyboard()
         )
     else:
@@ -1468,51 +1660,61 @@ async def cb_confirm_update(callback: CallbackQuery, state: FSMContext):
 
 # ============= Helper Functions =============
 
-def _format_time_ago(iso_time: str) -> str:
-    """Format ISO timestamp as relative time string."""
+def _format_time_ago(iso_time: str, now: datetime = None) -> str:
+    """Format ISO timestamp as relative time string.
+
+    Render loops that format many timestamps pass a shared `now` so the
+    clock is read once per render instead of once per row.
+    """
     if not iso_time:
         return "нет данных"
     try:
         check_time = datetime.fromisoformat(iso_time)
-        now = datetime.now()
-        diff = now - check_time
-        
-        if diff.total_seconds() < 60:
-            return "только что"
-        elif diff.total_seconds() < 3600:
-            mins = int(diff.total_seconds() / 60)
-            return f"{mins} мин назад"
-        elif diff.total_seconds() < 86400:
-            hours = int(diff.total_seconds() / 3600)
-            return f"{hours} ч назад"
-        else:
-            days = int(diff.total_seconds() / 86400)
-            return f"{days} дн назад"
-    except:
+    except ValueError:
         return "неизвестно"
 
+    if now is None:
+        now = datetime.now()
+    secs = (now - check_time).total_seconds()
+
+    if secs < 60:
+        return "только что"
+    elif secs < 3600:
+        return f"{int(secs / 60)} мин назад"
+    elif secs < 86400:
+        return f"{int(secs / 3600)} ч назад"
+    else:
+        return f"{int(secs / 86400)} дн назад"
+
+
+async def show_status(message: Message, edit: bool = False, servers: list[Server] = None):
+    """Show cached status of all servers from monitoring with version info.
+
+    Callers that already hold the server list (cb_refresh_all) pass it in
+    to skip the re-read.
+    """
+    storage = _storage()
+    if servers is None:
+        servers = storage.get_all_servers()
 
-async def show_status(message: Message, edit: bool = False):
-    """Show cached status of all servers from monitoring with version info."""
-    storage = get_storage()
-    servers = storage.get_all_servers()
-    
     if not servers:
         text = "📊 *Статус*\n\nУ тебя пока нет серверов."
         if edit:
-            await message.edit_text(text, parse_mode="Markdown", reply_markup=get_servers_menu())
+            await message.edit_text(text, reply_markup=get_servers_menu())
         else:
-            await message.answer(text, parse_mode="Markdown", reply_markup=get_servers_menu())
+            await message.answer(text, reply_markup=get_servers_menu())
         return
     
-    # Get cached health data
-    health_data = storage.get_all_server_health()
-    health_by_id = {h["server_id"]: h for h in health_data}
+    # Get cached health data, already keyed by server id
+    health_by_id = storage.get_all_server_health()
     
-    # Get last known version and check time
+    # Get last known version and check time. Parse it once here: inside
+    # the loop each server only needs the cheap VersionInfo comparison
     last_known_version = storage.get_last_known_version()
+    latest_info = parse_version(last_known_version) if last_known_version else None
     last_version_check = storage.get_setting("last_version_check")
-    version_check_time = _format_time_ago(last_version_check) if last_version_check else "не проверялось"
+    now = datetime.now()
+    version_check_time = _format_time_ago(last_version_check, now) if last_version_check else "не проверялось"
     
     # Check if monitoring is enabled
     monitoring_enabled = storage.get_setting("monitoring_enabled", "0") == "1"
@@ -1534,24 +1736,18 @@ async def show_status(message: Message, edit: bool = False):
         health = health_by_id.get(server.id)
         
         if health:
-            is_healthy = health.get("is_healthy", False)
-            last_check = health.get("last_check")
-            error_msg = health.get("error_message", "")
-            failures = health.get("consecutive_failures", 0)
-            
-            # Get detailed check results
-            ssh_ok = health.get("ssh_ok", False)
-            container_ok = health.get("container_running", False)
-            ui_ok = health.get("ui_accessible", False)
-            version = health.get("version")
-            
-            time_str = _format_time_ago(last_check)
-            status_icon = "🟢" if is_healthy else "🔴"
-            
+            is_healthy = health.is_healthy
+            error_msg = health.error_message or ""
+            failures = health.consecutive_failures
+            version = health.version
+
+            time_str = _format_time_ago(health.last_check, now)
+            status_icon = _RUN_BADGE[is_healthy]
+
             # Build check status line: SSH: ✓ | Docker: ✓ | UI: ✓
-            ssh_mark = "✓" if ssh_ok else "✗"
-            docker_mark = "✓" if container_ok else "✗"
-            ui_mark = "✓" if ui_ok else "—" if not server.n8n_url else "✗"
+            ssh_mark = "✓" if health.ssh_ok else "✗"
+            docker_mark = "✓" if health.container_running else "✗"
+            ui_mark = "✓" if health.ui_accessible else "—" if not server.n8n_url else "✗"
             
             checks_line = f"SSH: {ssh_mark} | Docker: {docker_mark} | UI: {ui_mark}"
             
@@ -1559,21 +1755,27 @@ async def show_status(message: Message, edit: bool = False):
             version_str = ""
             if version:
                 version_str = f"v{version}"
-                if last_known_version and compare_versions(version, last_known_version) < 0:
-                    version_str += " ⬆️"
-                elif last_known_version and compare_versions(version, last_known_version) == 0:
-                    version_str += " ✅"
+                if latest_info is not None:
+                    current_info = parse_version(version)
+                    if current_info is not None:
+                        cmp = (latest_info < current_info) - (current_info < latest_info)
+                        version_str += _CMP_BADGE[cmp]
             
+            # Collect the block's lines and join once instead of growing
+            # a string with += per conditional row
+            parts = [
+                f"{status_icon} *{server.name}*",
+                f"   └ 🕐 {time_str}",
+                f"   └ {checks_line}",
+            ]
             if is_healthy:
-                server_block = f"{status_icon} *{server.name}*\n   └ 🕐 {time_str}\n   └ {checks_line}"
                 if version_str:
-                    server_block += f"\n   └ {version_str}"
-                lines.append(server_block)
+                    parts.append(f"   └ {version_str}")
             else:
                 error_short = error_msg[:40] + "..." if error_msg and len(error_msg) > 40 else (error_msg or "")
                 failure_info = f" ({failures}x)" if failures > 1 else ""
-                server_block = f"{status_icon} *{server.name}*\n   └ 🕐 {time_str}\n   └ {checks_line}\n   └ ❌{failure_info} {error_short}"
-                lines.append(server_block)
+                parts.append(f"   └ ❌{failure_info} {error_short}")
+            lines.append("\n".join(parts))
         else:
             # No health data yet
             lines.append(
@@ -1582,103 +1784,128 @@ async def show_status(message: Message, edit: bool = False):
             )
     
     text = "\n".join(lines)
-    
+
     if edit:
-        await message.edit_text(text, parse_mode="Markdown", reply_markup=get_status_keyboard())
+        # Cached data often hasn't changed between taps: skip the edit
+        # round-trip when the rendered text is identical
+        await _edit_if_changed(message, text, reply_markup=get_status_keyboard())
     else:
-        await message.answer(text, parse_mode="Markdown", reply_markup=get_status_keyboard())
+        await message.answer(text, reply_markup=get_status_keyboard())
 
 
 async def show_live_status(message: Message):
     """Show live status of all servers (with SSH check)."""
-    storage = get_storage()
+    storage = _storage()
     servers = storage.get_all_servers()
     
     if not servers:
         await message.edit_text(
             "📊 *Статус серверов*\n\nУ тебя пока нет серверов.",
-            parse_mode="Markdown",
             reply_markup=get_servers_menu()
         )
         return
     
-    # Show loading message
-    await message.edit_text("🔄 Проверяю статус серверов...")
+    # Show loading message (skipped entirely if the caches answer fast)
+    _edit_text_coalesced(message, "🔄 Проверяю статус серверов...")
     
-    # Get status for all servers in parallel
-    tasks = [get_server_status(server) for server in servers]
-    statuses = await asyncio.gather(*tasks)
-    
-    # Get latest version
-    latest = await get_latest_version()
+    # Latest-version fetch and per-server probes are independent I/O:
+    # run them in one gather instead of paying the HTTP RTT separately
+    latest, *statuses = await asyncio.gather(
+        cached_latest_version(),
+        *(cached_server_status(server) for server in servers),
+        return_exceptions=True
+    )
+    if isinstance(latest, Exception):
+        latest = None
+    statuses = [
+        s if not isinstance(s, Exception) else {
+            "name": server.name, "host": server.host, "connected": False,
+            "error": str(s), "version": None, "running": False
+        }
+        for server, s in zip(servers, statuses)
+    ]
     latest_str = str(latest) if latest else "неизвестно"
     
-    # Format status message
-    lines = [f"📊 *Статус серверов (live)*\n\nПоследняя версия n8n: `{latest_str}`\n"]
-    
-    for status in statuses:
-        if status["connected"]:
-            version = status["version"] or "?"
-            running = "🟢" if status["running"] else "🔴"
-            
-            # Check if update needed
-            update_badge = ""
-            if latest and status["version"]:
-                cmp = compare_versions(status["version"], str(latest))
-                if cmp < 0:
-                    update_badge = " ⬆️"
-                elif cmp == 0:
-                    update_badge = " ✅"
-            
-            lines.append(
-                f"{running} *{status['name']}*\n"
-                f"   └ {status['host']} • v{version}{update_badge}"
-            )
-        else:
-            lines.append(
-                f"🔴 *{status['name']}*\n"
-                f"   └ {status['host']} • ❌ {status['error']}"
+    def format_status_line(status: dict) -> str:
+        name = status["name"]
+        host = status["host"]
+
+        if not status["connected"]:
+            return (
+                f"🔴 *{name}*\n"
+                f"   └ {host} • ❌ {status['error']}"
             )
-    
-    await message.edit_text(
-        "\n".join(lines),
-        parse_mode="Markdown",
-        reply_markup=get_status_keyboard()
-    )
+
+        version = status["version"]
+        running = _RUN_BADGE[bool(status["running"])]
+
+        # Check if update needed
+        update_badge = ""
+        if latest and version:
+            # latest is already parsed: compare int tuples directly
+            # instead of round-tripping it through str each iteration
+            current = parse_version(version)
+            if current is not None:
+                update_badge = _CMP_BADGE[(current > latest) - (current < latest)]
+
+        return (
+            f"{running} *{name}*\n"
+            f"   └ {host} • v{version or '?'}{update_badge}"
+        )
+
+    # Single pass: header plus one formatted block per server, one join
+    text = "\n".join([
+        f"📊 *Статус серверов (live)*\n\nПоследняя версия n8n: `{latest_str}`\n",
+        *map(format_status_line, statuses),
+    ])
+
+    await _edit_if_changed(message, text, reply_markup=get_status_keyboard())
 
 
 async def check_updates(message: Message, edit: bool = False):
     """Check for available updates."""
-    storage = get_storage()
+    storage = _storage()
     servers = storage.get_all_servers()
     
     if not servers:
         text = "🔍 *Проверка обновлений*\n\nУ тебя пока нет серверов."
         if edit:
-            await message.edit_text(text, parse_mode="Markdown", reply_markup=get_servers_menu())
+            await message.edit_text(text, reply_markup=get_servers_menu())
         else:
-            await message.answer(text, parse_mode="Markdown", reply_markup=get_servers_menu())
+            await message.answer(text, reply_markup=get_servers_menu())
         return
     
     loading_text = "🔍 Проверяю обновления..."
     if edit:
-        await message.edit_text(loading_text)
+        _edit_text_coalesced(message, loading_text)
     else:
         message = await message.answer(loading_text)
     
-    # Get latest version
-    latest = await get_latest_version()
-    
+    # Fetch the latest version and probe the servers in one gather:
+    # both are independent I/O, no need to serialize the HTTP RTT
+    latest, *statuses = await asyncio.gather(
+        cached_latest_version(),
+        *(cached_server_status(server) for server in servers),
+        return_exceptions=True
+    )
+    if isinstance(latest, Exception):
+        latest = None
+
     if not latest:
-        await message.edit_text(
+        await _edit_if_changed(
+            message,
             "❌ Не удалось получить информацию о последней версии n8n",
             reply_markup=get_back_keyboard()
         )
         return
-    
-    # Get current versions from all servers
-    tasks = [get_server_status(server) for server in servers]
-    statuses = await asyncio.gather(*tasks)
+
+    statuses = [
+        s if not isinstance(s, Exception) else {
+            "name": server.name, "host": server.host, "connected": False,
+            "error": str(s), "version": None, "running": False
+        }
+        for server, s in zip(servers, statuses)
+    ]
     
     updates_available = []
     up_to_date = []
@@ -1688,57 +1915,61 @@ async def check_updates(message: Message, edit: bool = False):
         if not status["connected"]:
             errors.append(status)
         elif status["version"]:
-            cmp = compare_versions(status["version"], str(latest))
-            if cmp < 0:
+            # Compare against the already-parsed latest, no str round-trip
+            current = parse_version(status["version"])
+            if current is not None and current < latest:
                 updates_available.append(status)
             else:
                 up_to_date.append(status)
         else:
             errors.append(status)
     
-    # Format message
-    lines = [f"🔍 *Проверка обновлений*\n\nПоследняя версия: `{latest}`\n"]
-    
+    # Format message: build each section with one generator pass and
+    # a single final join instead of repeated per-line appends
+    latest_str = str(latest)
+    lines = [f"🔍 *Проверка обновлений*\n\nПоследняя версия: `{latest_str}`\n"]
+
     if updates_available:
         lines.append("⬆️ *Доступны обновления:*")
-        for s in updates_available:
-            lines.append(f"   • {s['name']}: v{s['version']} → v{latest}")
+        lines.extend(f"   • {s['name']}: v{s['version']} → v{latest_str}" for s in updates_available)
         lines.append("")
-    
+
     if up_to_date:
         lines.append("✅ *Актуальны:*")
-        for s in up_to_date:
-            lines.append(f"   • {s['name']}: v{s['version']}")
+        lines.extend(f"   • {s['name']}: v{s['version']}" for s in up_to_date)
         lines.append("")
-    
+
     if errors:
         lines.append("❌ *Ошибки:*")
-        for s in errors:
-            lines.append(f"   • {s['name']}: {s.get('error', 'нет версии')}")
-    
-    await message.edit_text(
+        lines.extend(f"   • {s['name']}: {s.get('error', 'нет версии')}" for s in errors)
+
+    await _edit_if_changed(
+        message,
         "\n".join(lines),
-        parse_mode="Markdown",
         reply_markup=get_back_keyboard()
     )
 
 
 async def start_update_flow(message: Message, state: FSMContext, edit: bool = False):
     """Start the update server selection flow."""
-    storage = get_storage()
+    storage = _storage()
     servers = storage.get_all_servers()
     
     if not servers:
         text = "🔄 *Обновление серверов*\n\nУ тебя пока нет серверов."
         if edit:
-            await message.edit_text(text, parse_mode="Markdown", reply_markup=get_servers_menu())
+            await message.edit_text(text, reply_markup=get_servers_menu())
         else:
-            await message.answer(text, parse_mode="Markdown", reply_markup=get_servers_menu())
+            await message.answer(text, reply_markup=get_servers_menu())
         return
     
     await state.clear()
     await state.set_state(UpdateStates.selecting_servers)
-    
+
+    # Snapshot the server list for this selection session so every toggle
+    # in cb_select_server doesn't re-read storage just to redraw buttons
+    await state.update_data(servers_snapshot=servers, snapshot_at=time.monotonic())
+
     text = (
         "🔄 *Обновление серверов*\n\n"
         "Выбери серверы для обновления:"
@@ -1747,14 +1978,12 @@ async def start_update_flow(message: Message, state: FSMContext, edit: bool = Fa
     if edit:
         await message.edit_text(
             text,
-            parse_mode="Markdown",
-            reply_markup=get_servers_keyboard(servers, "select_server")
+            reply_markup=get_servers_keyboard(servers, "sel")
         )
     else:
         await message.answer(
             text,
-            parse_mode="Markdown",
-            reply_markup=get_servers_keyboard(servers, "select_server")
+            reply_markup=get_servers_keyboard(servers, "sel")
         )
 
 
@@ -1765,10 +1994,16 @@ def format_duration(seconds: float) -> str:
     return f"{minutes}:{secs:02d}"
 
 
+# Minimum spacing between progress edits during an update run. Telegram
+# allows roughly one edit per second per chat; staying well under that
+# keeps a long multi-server run from queueing behind its own progress.
+_PROGRESS_EDIT_INTERVAL = 2.0
+
+
 async def execute_updates(message: Message, server_names: list[str], edit: bool = False):
     """Execute updates on selected servers."""
-    storage = get_storage()
-    servers = [s for s in storage.get_all_servers() if s.name in server_names]
+    storage = _storage()
+    servers = storage.get_servers_by_names(server_names)
     verbose_mode = storage.get_verbose_updates()
 
     if not servers:
@@ -1782,112 +2017,143 @@ async def execute_updates(message: Message, server_names: list[str], edit: bool
     # Show progress
     text = f"🔄 *Обновление {len(servers)} сервера(ов)*\n\nЭто может занять несколько минут..."
     if edit:
-        await message.edit_text(text, parse_mode="Markdown")
+        await message.edit_text(text)
     else:
-        message = await message.answer(text, parse_mode="Markdown")
-
-    # Execute updates
-    results: list[UpdateResult] = []
-    failed_with_rollback: list[tuple[UpdateResult, int]] = []  # (result, backup_id)
+        message = await message.answer(text)
 
-    # Track completed steps for verbose mode
-    completed_steps: dict[str, list[tuple[int, str]]] = {}  # server_name -> [(step, message)]
+    # Step-by-step verbose progress only makes sense for a single server;
+    # parallel batches report the aggregate completion counter instead
+    verbose_mode = verbose_mode and len(servers) == 1
 
-    for server in servers:
-        start_time = time.time()
-        completed_steps[server.name] = []
-
-        # Progress callback for verbose mode
-        async def progress_callback(step: int, total: int, step_message: str):
-            if not verbose_mode:
-                return
-
-            elapsed = time.time() - start_time
-            completed_steps[server.name].append((step, step_message))
-
-            # Build progress display
-            lines = [
-                f"🔄 *Обновление серверов*",
-                f"",
-                f"*{server.name}* • ⏱️ {format_duration(elapsed)}",
-                f"",
-            ]
-
-            # Progress bar
-            progress_bar = ""
-            for i in range(1, total + 1):
-                if i < step:
-                    progress_bar += "✅"
-                elif i == step:
-                    progress_bar += "🔄"
-                else:
-                    progress_bar += "⏳"
+    failed_with_rollback: list[tuple[UpdateResult, int]] = []  # (result, backup_id)
 
-            lines.append(f"{progress_bar} {step}/{total}")
-            lines.append(f"")
-            lines.append(f"📍 {step_message}")
+    start_time = time.time()
+    completed_steps: list[tuple[int, str]] = []
+
+    # Progress edits go through one background task: workers just record
+    # the newest text and set the event, so Telegram latency never sits
+    # on the update critical path and rapid steps collapse into one edit
+    progress_state: dict[str, str | None] = {"text": None}
+    progress_event = asyncio.Event()
+
+    async def progress_editor():
+        last_sent = None
+        while True:
+            await progress_event.wait()
+            progress_event.clear()
+            text = progress_state["text"]
+            if text and text != last_sent:
+                last_sent = text
+                try:
+                    await message.edit_text(text)
+                except Exception:
+                    pass  # Ignore edit errors (rate limiting, etc)
+            # Fixed flush interval: the first update goes out right away,
+            # anything arriving within the window coalesces into the next
+            await asyncio.sleep(_PROGRESS_EDIT_INTERVAL)
+
+    def report_progress(text: str):
+        progress_state["text"] = text
+        progress_event.set()
+
+    # Progress callback for verbose (single-server) mode
+    async def progress_callback(step: int, total: int, step_message: str):
+        elapsed = time.time() - start_time
+        completed_steps.append((step, step_message))
+
+        # Build progress display
+        lines = [
+            f"🔄 *Обновление серверов*",
+            f"",
+            f"*{servers[0].name}* • ⏱️ {format_duration(elapsed)}",
+            f"",
+        ]
+
+        # Progress bar
+        progress_bar = ""
+        for i in range(1, total + 1):
+            if i < step:
+                progress_bar += "✅"
+            elif i == step:
+                progress_bar += "🔄"
+            else:
+                progress_bar += "⏳"
 
-            # Show completed steps
-            if len(completed_steps[server.name]) > 1:
-                lines.append(f"")
-                for prev_step, prev_msg in completed_steps[server.name][:-1]:
-                    lines.append(f"  ✓ {prev_msg}")
+        lines.append(f"{progress_bar} {step}/{total}")
+        lines.append(f"")
+        lines.append(f"📍 {step_message}")
 
-            # Show overall progress
+        # Show completed steps
+        if len(completed_steps) > 1:
             lines.append(f"")
-            lines.append(f"Серверов: {len(results)}/{len(servers)}")
+            for prev_step, prev_msg in completed_steps[:-1]:
+                lines.append(f"  ✓ {prev_msg}")
 
-            try:
-                await message.edit_text(
-                    "\n".join(lines),
-                    parse_mode="Markdown"
-                )
-            except Exception:
-                pass  # Ignore edit errors (rate limiting, etc)
-
-        # Show simple progress for non-verbose mode
-        if not verbose_mode:
-            await message.edit_text(
-                f"🔄 *Обновление серверов*\n\n"
-                f"Текущий: {server.name}...\n"
-                f"Завершено: {len(results)}/{len(servers)}",
-                parse_mode="Markdown"
-            )
-
-        executor = SSHExecutor(server)
-        result = await executor.update_n8n(
-            progress_callback=progress_callback if verbose_mode else None
-        )
-        results.append(result)
+        report_progress("\n".join(lines))
 
-        # Save backup info if available
-        backup_id = None
-        if result.compose_backup_path:
-            backup_id = storage.save_backup_info(
-                server_id=server.id,
-                server_name=server.name,
-                compose_backup_path=result.compose_backup_path,
-                data_backup_path=result.data_backup_path,
-                old_version=result.old_version or ""
+    async def update_one(server: Server) -> UpdateResult:
+        """Update a single server under the shared concurrency limit."""
+        async with _update_semaphore:
+            executor = SSHExecutor(server)
+            result = await executor.update_n8n(
+                progress_callback=progress_callback if verbose_mode else None
             )
-            # Clean up old backups (keep last 3)
-            storage.delete_old_backups(server.id, keep_count=3)
-
-        # Track failed updates that can be rolled back
-        if not result.success and result.can_rollback and backup_id:
-            failed_with_rollback.append((result, backup_id))
 
-        # Save to history
-        storage.add_update_history(
+        # Persist the outcome. SQLite writes are synchronous: run them in
+        # a worker thread so they can't stall the event loop (and the
+        # progress editor) while other updates are in flight. Backup row,
+        # backup pruning and the history entry share one transaction, so
+        # each server costs a single commit instead of three
+        backup_id = await asyncio.to_thread(
+            storage.record_update_result,
             server_id=server.id,
             server_name=server.name,
             old_version=result.old_version or "",
             new_version=result.new_version or "",
             success=result.success,
             message=result.message,
-            details=result.details
+            details=result.details,
+            compose_backup_path=result.compose_backup_path,
+            data_backup_path=result.data_backup_path
         )
 
+        # Track failed updates that can be rolled back
+        if not result.success and result.can_rollback and backup_id:
+            failed_with_rollback.append((result, backup_id))
+        return result
+
+    # Fan out in parallel (bounded by the semaphore), ticking the
+    # completion counter as servers finish instead of updating serially
+    progress_task = asyncio.create_task(progress_editor())
+    tasks = [asyncio.create_task(update_one(server)) for server in servers]
+    results_by_name: dict[str, UpdateResult] = {}
+    try:
+        for finished in asyncio.as_completed(tasks):
+            result = await finished
+            results_by_name[result.server_name] = result
+
+            if not verbose_mode:
+                report_progress(
+                    f"🔄 *Обновление серверов*\n\n"
+                    f"Завершено: {len(results_by_name)}/{len(servers)}"
+                )
+    except asyncio.CancelledError:
+        # Shutdown mid-batch: cancel remaining workers and wait for them
+        # so SSH sessions get closed before the loop goes away
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    finally:
+        progress_task.cancel()
+        try:
+            await progress_task
+        except asyncio.CancelledError:
+            pass
+
+    # Report in the original selection order
+    results: list[UpdateResult] = [results_by_name[s.name] for s in servers]
+
     # Format results
     lines = ["🏁 *Результаты обновления*\n"]
 
@@ -1908,7 +2174,6 @@ async def execute_updates(message: Message, server_names: list[str], edit: bool
 
     await message.edit_text(
         "\n".join(lines),
-        parse_mode="Markdown",
         reply_markup=get_back_keyboard()
     )
 
@@ -1921,8 +2186,20 @@ async def execute_updates(message: Message, server_names: list[str], edit: bool
                 f"**Ошибка:** {result.message}\n"
                 f"**Предыдущая версия:** v{result.old_version or 'unknown'}\n\n"
                 f"Хочешь откатить к предыдущей версии?",
-                parse_mode="Markdown",
                 reply_markup=get_rollback_keyboard(server.id, backup_id)
             )
 
     return results
+
+
+# ============= Fallback =============
+
+# Registered last: anything that reached this point came from a button
+# on an old message whose callback data no longer matches any handler
+# (renamed prefixes, removed features). Answer it instead of letting the
+# client spin on an unacknowledged query.
+@router.callback_query()
+async def cb_unknown(callback: CallbackQuery):
+    """Acknowledge stale or unknown callback buttons."""
+    logger.debug(f"Unknown callback data: {callback.data!r}")
+    await callback.answer("Устарело. Используй /start", show_alert=False)
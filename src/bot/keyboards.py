@@ -1,11 +1,37 @@
 """Inline keyboards for Telegram bot."""
 
+import functools
+
+from aiogram.filters.callback_data import CallbackData
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 from ..storage import Server
 
 
+class ServerCB(CallbackData, prefix="srv"):
+    """Callback data for per-server actions (details, test, delete...)."""
+
+    action: str
+    server_id: int
+
+
+class HistoryCB(CallbackData, prefix="hist"):
+    """Callback data for update-history pagination."""
+
+    action: str
+    offset: int = 0
+
+
+class RollbackCB(CallbackData, prefix="rb"):
+    """Callback data for post-update rollback decisions."""
+
+    action: str
+    server_id: int
+    backup_id: int
+
+
+@functools.lru_cache(maxsize=None)
 def get_main_menu(has_servers: bool = True) -> InlineKeyboardMarkup:
     """Get main menu keyboard."""
     builder = InlineKeyboardBuilder()
@@ -31,6 +57,7 @@ def get_main_menu(has_servers: bool = True) -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@functools.lru_cache(maxsize=None)
 def get_servers_menu() -> InlineKeyboardMarkup:
     """Get servers management menu."""
     builder = InlineKeyboardBuilder()
@@ -50,47 +77,44 @@ def get_servers_menu() -> InlineKeyboardMarkup:
 
 def get_servers_list_keyboard(servers: list[Server]) -> InlineKeyboardMarkup:
     """Get keyboard with server list for management."""
-    builder = InlineKeyboardBuilder()
-    
-    for server in servers:
-        builder.row(
-            InlineKeyboardButton(
-                text=f"🖥 {server.name} ({server.host})",
-                callback_data=f"server_details:{server.id}"
-            )
-        )
-    
-    builder.row(
-        InlineKeyboardButton(text="➕ Добавить", callback_data="add_server"),
-    )
-    builder.row(
-        InlineKeyboardButton(text="🏠 Меню", callback_data="menu"),
-    )
-    
-    return builder.as_markup()
-
-
+    # Built per call (shows mutable host/name data), so skip the builder
+    # and assemble the row list directly: one markup validation instead
+    # of one per .row() call, which adds up for large fleets
+    rows = [
+        [InlineKeyboardButton(
+            text=f"🖥 {server.name} ({server.host})",
+            callback_data=ServerCB(action="details", server_id=server.id).pack()
+        )]
+        for server in servers
+    ]
+    rows.append([InlineKeyboardButton(text="➕ Добавить", callback_data="add_server")])
+    rows.append([InlineKeyboardButton(text="🏠 Меню", callback_data="menu")])
+
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+@functools.lru_cache(maxsize=64)
 def get_server_details_keyboard(server_id: int, has_url: bool = False) -> InlineKeyboardMarkup:
     """Get keyboard for server details view."""
     builder = InlineKeyboardBuilder()
     
     builder.row(
-        InlineKeyboardButton(text="🔗 Проверить подключение", callback_data=f"test_server:{server_id}"),
+        InlineKeyboardButton(text="🔗 Проверить подключение", callback_data=ServerCB(action="test", server_id=server_id).pack()),
     )
     
     if has_url:
         builder.row(
-            InlineKeyboardButton(text="🩺 Health Check", callback_data=f"health_check:{server_id}"),
+            InlineKeyboardButton(text="🩺 Health Check", callback_data=ServerCB(action="health", server_id=server_id).pack()),
         )
     
     builder.row(
-        InlineKeyboardButton(text="🌐 Настроить URL", callback_data=f"set_url:{server_id}"),
+        InlineKeyboardButton(text="🌐 Настроить URL", callback_data=ServerCB(action="set_url", server_id=server_id).pack()),
     )
     builder.row(
-        InlineKeyboardButton(text="📜 История сервера", callback_data=f"server_history:{server_id}"),
+        InlineKeyboardButton(text="📜 История сервера", callback_data=ServerCB(action="history", server_id=server_id).pack()),
     )
     builder.row(
-        InlineKeyboardButton(text="🗑 Удалить", callback_data=f"delete_server:{server_id}"),
+        InlineKeyboardButton(text="🗑 Удалить", callback_data=ServerCB(action="delete", server_id=server_id).pack()),
     )
     builder.row(
         InlineKeyboardButton(text="⬅️ Назад", callback_data="list_servers"),
@@ -102,20 +126,22 @@ def get_server_details_keyboard(server_id: int, has_url: bool = False) -> Inline
     return builder.as_markup()
 
 
+@functools.lru_cache(maxsize=64)
 def get_confirm_delete_keyboard(server_id: int) -> InlineKeyboardMarkup:
     """Get confirmation keyboard for server deletion."""
     builder = InlineKeyboardBuilder()
     
     builder.row(
-        InlineKeyboardButton(text="✅ Да, удалить", callback_data=f"confirm_delete:{server_id}"),
+        InlineKeyboardButton(text="✅ Да, удалить", callback_data=ServerCB(action="confirm_delete", server_id=server_id).pack()),
     )
     builder.row(
-        InlineKeyboardButton(text="❌ Отмена", callback_data=f"server_details:{server_id}"),
+        InlineKeyboardButton(text="❌ Отмена", callback_data=ServerCB(action="details", server_id=server_id).pack()),
     )
     
     return builder.as_markup()
 
 
+@functools.lru_cache(maxsize=None)
 def get_auth_type_keyboard() -> InlineKeyboardMarkup:
     """Get keyboard for selecting auth type."""
     builder = InlineKeyboardBuilder()
@@ -140,48 +166,54 @@ def get_servers_keyboard(
 ) -> InlineKeyboardMarkup:
     """
     Get keyboard for selecting servers.
-    
+
     Args:
         servers: List of server configs.
         action: Action prefix for callback data.
         selected: Set of selected server names (for multi-select).
     """
-    builder = InlineKeyboardBuilder()
-    selected = selected or set()
-    
-    for server in servers:
-        is_selected = server.name in selected
-        prefix = "✅ " if is_selected else ""
-        builder.row(
-            InlineKeyboardButton(
-                text=f"{prefix}{server.name}",
-                callback_data=f"{action}:{server.name}"
-            )
-        )
-    
-    # Add "All servers" button
-    all_selected = len(selected) == len(servers)
-    all_prefix = "✅ " if all_selected else ""
-    builder.row(
-        InlineKeyboardButton(
-            text=f"{all_prefix}Все серверы",
-            callback_data=f"{action}:__all__"
-        )
+    # Only the names and the selection affect the markup; delegate to a
+    # cached builder keyed by hashable equivalents so toggling selections
+    # back and forth reuses markups instead of rebuilding them
+    return _build_servers_keyboard(
+        tuple(server.name for server in servers),
+        action,
+        frozenset(selected) if selected else frozenset(),
     )
-    
+
+
+@functools.lru_cache(maxsize=32)
+def _build_servers_keyboard(
+    names: tuple[str, ...],
+    action: str,
+    selected: frozenset[str]
+) -> InlineKeyboardMarkup:
+    """Build the server-selection markup (cached; see get_servers_keyboard)."""
+    rows = [
+        [InlineKeyboardButton(
+            text=f"✅ {name}" if name in selected else name,
+            callback_data=f"{action}:{name}"
+        )]
+        for name in names
+    ]
+
+    # Add "All servers" button
+    all_prefix = "✅ " if len(selected) == len(names) else ""
+    rows.append([InlineKeyboardButton(
+        text=f"{all_prefix}Все серверы",
+        callback_data=f"{action}:__all__"
+    )])
+
     # Add action buttons
     if selected:
-        builder.row(
-            InlineKeyboardButton(text="▶️ Продолжить", callback_data=f"{action}:__confirm__"),
-        )
-    
-    builder.row(
-        InlineKeyboardButton(text="❌ Отмена", callback_data="cancel"),
-    )
-    
-    return builder.as_markup()
+        rows.append([InlineKeyboardButton(text="▶️ Продолжить", callback_data=f"{action}:__confirm__")])
+
+    rows.append([InlineKeyboardButton(text="❌ Отмена", callback_data="cancel")])
+
+    return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
+@functools.lru_cache(maxsize=None)
 def get_time_keyboard(servers_key: str) -> InlineKeyboardMarkup:
     """
     Get keyboard for selecting update time.
@@ -223,6 +255,7 @@ def get_time_keyboard(servers_key: str) -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@functools.lru_cache(maxsize=32)
 def get_confirm_update_keyboard(servers_key: str, time_key: str) -> InlineKeyboardMarkup:
     """Get confirmation keyboard before starting update."""
     builder = InlineKeyboardBuilder()
@@ -240,6 +273,7 @@ def get_confirm_update_keyboard(servers_key: str, time_key: str) -> InlineKeyboa
     return builder.as_markup()
 
 
+@functools.lru_cache(maxsize=None)
 def get_back_keyboard() -> InlineKeyboardMarkup:
     """Get keyboard with back to menu button."""
     builder = InlineKeyboardBuilder()
@@ -249,6 +283,7 @@ def get_back_keyboard() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@functools.lru_cache(maxsize=None)
 def get_settings_keyboard() -> InlineKeyboardMarkup:
     """Get settings menu keyboard."""
     builder = InlineKeyboardBuilder()
@@ -269,6 +304,7 @@ def get_settings_keyboard() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@functools.lru_cache(maxsize=None)
 def get_verbose_keyboard(enabled: bool = False) -> InlineKeyboardMarkup:
     """Get verbose mode settings keyboard."""
     builder = InlineKeyboardBuilder()
@@ -289,6 +325,7 @@ def get_verbose_keyboard(enabled: bool = False) -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@functools.lru_cache(maxsize=None)
 def get_monitoring_keyboard(enabled: bool = False) -> InlineKeyboardMarkup:
     """Get monitoring settings keyboard."""
     builder = InlineKeyboardBuilder()
@@ -309,13 +346,14 @@ def get_monitoring_keyboard(enabled: bool = False) -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@functools.lru_cache(maxsize=None)
 def get_history_keyboard(has_more: bool = False, offset: int = 0) -> InlineKeyboardMarkup:
     """Get keyboard for update history view."""
     builder = InlineKeyboardBuilder()
     
     if has_more:
         builder.row(
-            InlineKeyboardButton(text="📜 Показать ещё", callback_data=f"history:more:{offset}"),
+            InlineKeyboardButton(text="📜 Показать ещё", callback_data=HistoryCB(action="more", offset=offset).pack()),
         )
     
     builder.row(
@@ -325,6 +363,7 @@ def get_history_keyboard(has_more: bool = False, offset: int = 0) -> InlineKeybo
     return builder.as_markup()
 
 
+@functools.lru_cache(maxsize=None)
 def get_history_detail_keyboard(entry_id: int) -> InlineKeyboardMarkup:
     """Get keyboard for history entry details."""
     builder = InlineKeyboardBuilder()
@@ -339,6 +378,7 @@ def get_history_detail_keyboard(entry_id: int) -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@functools.lru_cache(maxsize=None)
 def get_interval_keyboard() -> InlineKeyboardMarkup:
     """Get keyboard for selecting check interval."""
     builder = InlineKeyboardBuilder()
@@ -355,6 +395,7 @@ def get_interval_keyboard() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@functools.lru_cache(maxsize=None)
 def get_skip_keyboard(field: str) -> InlineKeyboardMarkup:
     """Get keyboard with skip option for optional fields."""
     builder = InlineKeyboardBuilder()
@@ -369,6 +410,7 @@ def get_skip_keyboard(field: str) -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@functools.lru_cache(maxsize=None)
 def get_cancel_keyboard() -> InlineKeyboardMarkup:
     """Get keyboard with only cancel button."""
     builder = InlineKeyboardBuilder()
@@ -378,6 +420,7 @@ def get_cancel_keyboard() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@functools.lru_cache(maxsize=64)
 def get_rollback_keyboard(server_id: int, backup_id: int) -> InlineKeyboardMarkup:
     """Get keyboard for rollback confirmation after failed update."""
     builder = InlineKeyboardBuilder()
@@ -385,19 +428,20 @@ def get_rollback_keyboard(server_id: int, backup_id: int) -> InlineKeyboardMarku
     builder.row(
         InlineKeyboardButton(
             text="⏪ Откатить к предыдущей версии",
-            callback_data=f"rollback_confirm:{server_id}:{backup_id}"
+            callback_data=RollbackCB(action="confirm", server_id=server_id, backup_id=backup_id).pack()
         ),
     )
     builder.row(
         InlineKeyboardButton(
             text="❌ Оставить как есть",
-            callback_data=f"rollback_skip:{server_id}:{backup_id}"
+            callback_data=RollbackCB(action="skip", server_id=server_id, backup_id=backup_id).pack()
         ),
     )
     
     return builder.as_markup()
 
 
+@functools.lru_cache(maxsize=None)
 def get_rollback_result_keyboard() -> InlineKeyboardMarkup:
     """Get keyboard after rollback result."""
     builder = InlineKeyboardBuilder()
@@ -412,6 +456,7 @@ def get_rollback_result_keyboard() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@functools.lru_cache(maxsize=None)
 def get_status_keyboard() -> InlineKeyboardMarkup:
     """Get keyboard for cached status view."""
     builder = InlineKeyboardBuilder()
@@ -0,0 +1,136 @@
+"""Session middlewares for outbound Telegram API calls."""
+
+import asyncio
+import hashlib
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+
+logger = logging.getLogger(__name__)
+
+
+# Hash of the text last successfully written to each message. Kept here,
+# at the session layer, so it stays accurate no matter which handler
+# performed the edit; handlers use it to skip edits that would re-send
+# identical content (which Telegram rejects anyway).
+last_edit_hash: dict[tuple[int, int], bytes] = {}
+
+
+def text_digest(text: str) -> bytes:
+    """Short digest of message text for change detection."""
+    return hashlib.blake2b(text.encode(), digest_size=8).digest()
+
+
+class EditTrackingMiddleware(BaseRequestMiddleware):
+    """Record a digest of every successful EditMessageText payload."""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        response = await make_request(bot, method)
+
+        if type(method).__name__ == "EditMessageText":
+            chat_id = getattr(method, "chat_id", None)
+            message_id = getattr(method, "message_id", None)
+            text = getattr(method, "text", None)
+            if isinstance(chat_id, int) and isinstance(message_id, int) and text:
+                last_edit_hash[(chat_id, message_id)] = text_digest(text)
+
+        return response
+
+
+class _TokenBucket:
+    """Simple token bucket: allows `rate` calls per second with small bursts."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until a token is available, then consume it."""
+        async with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+            if self.tokens < 1:
+                wait = (1 - self.tokens) / self.rate
+                await asyncio.sleep(wait)
+                self.updated = time.monotonic()
+                self.tokens = 1
+
+            self.tokens -= 1
+
+
+class RateLimitMiddleware(BaseRequestMiddleware):
+    """
+    Throttle outbound messages to stay under Telegram's limits.
+
+    Telegram allows roughly 30 messages/s bot-wide and ~1 message/s per
+    chat; bursts over those limits produce 429 storms where retries make
+    things worse. Every send/edit acquires a global token plus a
+    per-chat token before the HTTP call goes out.
+    """
+
+    # Methods that count against Telegram's messaging limits
+    _LIMITED_METHODS = frozenset({
+        "SendMessage",
+        "EditMessageText",
+        "EditMessageReplyMarkup",
+        "SendDocument",
+        "SendPhoto",
+    })
+
+    def __init__(self, global_rate: float = 25.0, chat_rate: float = 1.0):
+        self._global_bucket = _TokenBucket(rate=global_rate, burst=global_rate)
+        self._chat_rate = chat_rate
+        self._chat_buckets: dict[int, _TokenBucket] = {}
+
+    def _chat_bucket(self, chat_id: int) -> _TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            # Allow short bursts of 3 in a chat, then settle to chat_rate
+            bucket = _TokenBucket(rate=self._chat_rate, burst=3)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        if type(method).__name__ not in self._LIMITED_METHODS:
+            return await make_request(bot, method)
+
+        await self._global_bucket.acquire()
+        chat_id = getattr(method, "chat_id", None)
+        if isinstance(chat_id, int):
+            await self._chat_bucket(chat_id).acquire()
+
+        # Flood-wait and transient network errors get one retry here so
+        # scheduler notifications aren't silently dropped under bursts
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter as e:
+            logger.warning(f"Flood wait {e.retry_after}s for {type(method).__name__}, retrying")
+            await asyncio.sleep(e.retry_after)
+            return await make_request(bot, method)
+        except TelegramNetworkError as e:
+            logger.warning(f"Network error for {type(method).__name__} ({e}), retrying in 1s")
+            await asyncio.sleep(1.0)
+            return await make_request(bot, method)
@@ -11,11 +11,15 @@ from typing import Optional
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.fsm.storage.memory import MemoryStorage
 
 from .storage import init_storage
 from .scheduler import UpdateScheduler
-from .bot.handlers import router, set_scheduler
+from .ssh_executor import close_all_ssh_clients
+from .version_checker import close_http_session, seed_latest_version
+from .bot.handlers import router, set_scheduler, cancel_background_tasks
+from .bot.middlewares import EditTrackingMiddleware, RateLimitMiddleware
 
 # Configure logging
 logging.basicConfig(
@@ -34,6 +38,26 @@ logging.getLogger("aiogram").setLevel(logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def _make_bot_session() -> AiohttpSession:
+    """
+    Build the Telegram API session, with orjson if available.
+
+    Every outbound call serializes its payload (reply_markup dominates
+    for keyboard-heavy handlers); orjson does that several times faster
+    than stdlib json. Optional, like uvloop: stdlib is the fallback.
+    """
+    try:
+        import orjson
+    except ImportError:
+        return AiohttpSession()
+
+    return AiohttpSession(
+        json_loads=orjson.loads,
+        # aiogram expects a str-returning dumps; orjson emits bytes
+        json_dumps=lambda obj: orjson.dumps(obj).decode(),
+    )
+
+
 class N8nUpdater:
     """Main application class."""
     
@@ -65,13 +89,23 @@ class N8nUpdater:
         except Exception as e:
             logger.error(f"Failed to initialize storage: {e}")
             sys.exit(1)
-        
+
+        # Warm the version cache from the last persisted check so the
+        # first status render doesn't wait on Docker Hub
+        last_known = storage.get_last_known_version()
+        if last_known:
+            seed_latest_version(last_known)
+
+
         # Initialize bot
         self.bot = Bot(
             token=self.bot_token,
+            session=_make_bot_session(),
             default=DefaultBotProperties(parse_mode=ParseMode.MARKDOWN)
         )
-        
+        self.bot.session.middleware(RateLimitMiddleware())
+        self.bot.session.middleware(EditTrackingMiddleware())
+
         # Initialize dispatcher with FSM storage
         self.dp = Dispatcher(storage=MemoryStorage())
         self.dp.include_router(router)
@@ -103,7 +137,6 @@ class N8nUpdater:
                 await self.bot.send_message(
                     admin_id,
                     "🟢 *n8n Updater запущен*\n\nИспользуй /start для работы.",
-                    parse_mode="Markdown"
                 )
             except Exception as e:
                 logger.warning(f"Could not send startup notification: {e}")
@@ -128,11 +161,19 @@ class N8nUpdater:
         # Stop scheduler
         if self.scheduler:
             self.scheduler.stop()
-        
-        # Close bot session
+
+        # The remaining teardown steps are independent: drain background
+        # work, close the HTTP session and the bot session concurrently
+        # instead of paying each close serially
+        closers = [cancel_background_tasks(), close_http_session()]
         if self.bot:
-            await self.bot.session.close()
-        
+            closers.append(self.bot.session.close())
+        await asyncio.gather(*closers, return_exceptions=True)
+
+        # Pooled SSH connections close last (background tasks may have
+        # been using them until the drain above finished)
+        close_all_ssh_clients()
+
         logger.info("n8n Updater stopped")
     
     def _handle_shutdown(self):
@@ -173,7 +214,16 @@ def run():
     args = parser.parse_args()
     
     db_path = Path(args.db) if args.db else None
-    
+
+    # Use uvloop where available (Linux/macOS): faster event loop for the
+    # await-heavy handlers, falls back to asyncio's default loop otherwise
+    try:
+        import uvloop
+        uvloop.install()
+        logger.info("Using uvloop event loop")
+    except ImportError:
+        pass
+
     try:
         asyncio.run(main(args.token, db_path))
     except KeyboardInterrupt:
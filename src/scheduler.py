@@ -2,34 +2,89 @@
 
 import asyncio
 import logging
+import os
 import uuid
 from datetime import datetime
 from typing import Optional
 
+from apscheduler.executors.asyncio import AsyncIOExecutor
+from apscheduler.jobstores.memory import MemoryJobStore
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 from apscheduler.triggers.date import DateTrigger
 from aiogram import Bot
 
 from .storage import get_storage, Server
-from .version_checker import get_latest_version, compare_versions, get_release_changelog
-from .ssh_executor import SSHExecutor, get_server_status, UpdateResult, perform_full_health_check
+from .version_checker import cached_latest_version, parse_version, get_release_changelog
+from .ssh_executor import SSHExecutor, cached_server_status, UpdateResult, perform_full_health_check
+from .bot.keyboards import get_main_menu
 
 logger = logging.getLogger(__name__)
 
+# All scheduler notifications attach the same main-menu markup; resolve
+# it once instead of re-importing and re-calling per send
+_MAIN_MENU = get_main_menu(has_servers=True)
+
+# Cap parallel SSH updates: enough to overlap network waits without
+# opening handshakes to every server at once
+# (tunable for large fleets, like N8N_SSH_CONCURRENCY for probes)
+_update_semaphore = asyncio.Semaphore(int(os.getenv("N8N_UPDATE_CONCURRENCY", "4")))
+
+# How long queued notifications wait for more to arrive before one
+# consolidated message goes out per chat
+_NOTIFY_FLUSH_DELAY = 2.0
+
 
 class UpdateScheduler:
     """Manages scheduled version checks and updates."""
     
     def __init__(self, bot: Bot):
         self.bot = bot
-        self.scheduler = AsyncIOScheduler()
+        # All jobs are coroutines held in memory: pin the in-memory
+        # store and the asyncio executor explicitly so apscheduler
+        # doesn't spin up its default ThreadPoolExecutor for them
+        self.scheduler = AsyncIOScheduler(
+            jobstores={"default": MemoryJobStore()},
+            executors={"default": AsyncIOExecutor()},
+        )
+        # Storage singleton is initialized before the scheduler is
+        # constructed; bind it once instead of looking it up per job run
+        self.storage = get_storage()
         self._version_check_job_id = "version_check"
         self._monitoring_job_id = "server_monitoring"
+        # Outbound notifications coalesce per chat: jobs firing close
+        # together produce one consolidated message instead of a burst
+        self._pending_notifications: dict[int, list[str]] = {}
+        self._flush_tasks: dict[int, asyncio.Task] = {}
+
+    def _queue_notification(self, chat_id: int, text: str):
+        """Queue a notification; a short debounce merges bursts per chat."""
+        self._pending_notifications.setdefault(chat_id, []).append(text)
+        if chat_id not in self._flush_tasks:
+            self._flush_tasks[chat_id] = asyncio.create_task(
+                self._flush_notifications(chat_id)
+            )
+
+    async def _flush_notifications(self, chat_id: int):
+        """Send everything queued for a chat as one message."""
+        await asyncio.sleep(_NOTIFY_FLUSH_DELAY)
+        texts = self._pending_notifications.pop(chat_id, [])
+        self._flush_tasks.pop(chat_id, None)
+        if not texts:
+            return
+        try:
+            await self.bot.send_message(
+                chat_id,
+                "\n\n".join(texts),
+                reply_markup=_MAIN_MENU,
+                disable_web_page_preview=True
+            )
+        except Exception as e:
+            logger.error(f"Failed to send notification: {e}")
     
     async def start(self):
         """Start the scheduler."""
-        storage = get_storage()
+        storage = self.storage
         interval = storage.get_check_interval()
         
         # Schedule periodic version check
@@ -59,32 +114,35 @@ class UpdateScheduler:
     def stop(self):
         """Stop the scheduler."""
         self.scheduler.shutdown(wait=False)
+        for task in self._flush_tasks.values():
+            task.cancel()
         logger.info("Scheduler stopped.")
     
     async def update_check_interval(self, hours: int):
         """Update the version check interval."""
-        # Remove old job
+        # Reschedule in place: one call instead of remove+add
         try:
-            self.scheduler.remove_job(self._version_check_job_id)
+            self.scheduler.reschedule_job(
+                self._version_check_job_id,
+                trigger=IntervalTrigger(hours=hours)
+            )
         except Exception:
-            pass
-        
-        # Add new job with updated interval
-        self.scheduler.add_job(
-            self._check_for_updates,
-            IntervalTrigger(hours=hours),
-            id=self._version_check_job_id,
-            name="Periodic n8n version check",
-            replace_existing=True
-        )
-        
+            # Job missing (scheduler restarted without it) — recreate
+            self.scheduler.add_job(
+                self._check_for_updates,
+                IntervalTrigger(hours=hours),
+                id=self._version_check_job_id,
+                name="Periodic n8n version check",
+                replace_existing=True
+            )
+
         logger.info(f"Check interval updated to {hours} hours")
     
     async def _check_for_updates(self):
         """Check for new n8n versions and notify if found."""
         logger.info("Checking for n8n updates...")
         
-        storage = get_storage()
+        storage = self.storage
         admin_id = storage.get_admin_chat_id()
         
         if not admin_id:
@@ -97,7 +155,7 @@ class UpdateScheduler:
             return
         
         try:
-            latest = await get_latest_version()
+            latest = await cached_latest_version(force_refresh=True)
             
             if not latest:
                 logger.warning("Could not fetch latest version")
@@ -111,16 +169,23 @@ class UpdateScheduler:
                 logger.info(f"No new version. Current latest: {latest_str}")
                 return
             
-            # Get server statuses
-            tasks = [get_server_status(server) for server in servers]
-            statuses = await asyncio.gather(*tasks)
+            # Get server statuses. cached_server_status bounds the SSH
+            # fan-out with the shared probe semaphore, so a large fleet
+            # doesn't open a handshake (and paramiko thread) per server
+            # all at once
+            statuses = await asyncio.gather(
+                *(cached_server_status(server) for server in servers)
+            )
             
-            # Find servers needing updates
+            # Find servers needing updates. The latest version is loop
+            # invariant: parse it once instead of per server inside
+            # compare_versions
+            latest_info = parse_version(latest_str)
             servers_needing_update = []
             for status in statuses:
                 if status["connected"] and status["version"]:
-                    cmp = compare_versions(status["version"], latest_str)
-                    if cmp < 0:
+                    current_info = parse_version(status["version"])
+                    if current_info and latest_info and current_info < latest_info:
                         servers_needing_update.append(status)
             
             # Update last known version and check time
@@ -159,23 +224,11 @@ class UpdateScheduler:
             lines.append(f"\n🔗 [Подробнее на GitHub]({release_info.url})")
         
         lines.append("\n*Серверы, требующие обновления:*")
-        for server in servers:
-            lines.append(f"   • {server['name']}: v{server['version']}")
-        
+        lines.extend(f"   • {server['name']}: v{server['version']}" for server in servers)
         lines.append("\nИспользуй /update для обновления.")
         
-        try:
-            from .bot.keyboards import get_main_menu
-            await self.bot.send_message(
-                chat_id,
-                "\n".join(lines),
-                parse_mode="Markdown",
-                reply_markup=get_main_menu(has_servers=True),
-                disable_web_page_preview=True
-            )
-            logger.info(f"Update notification sent for version {latest_version}")
-        except Exception as e:
-            logger.error(f"Failed to send update notification: {e}")
+        self._queue_notification(chat_id, "\n".join(lines))
+        logger.info(f"Update notification queued for version {latest_version}")
     
     async def schedule_update(
         self,
@@ -218,46 +271,64 @@ class UpdateScheduler:
         job_id: str
     ):
         """Execute a scheduled update."""
-        storage = get_storage()
+        storage = self.storage
         
         logger.info(f"Executing scheduled update {job_id} for {server_names}")
         
         # Notify start
-        try:
-            await self.bot.send_message(
-                chat_id,
-                f"🔄 *Запуск запланированного обновления*\n\n"
-                f"Серверы: {', '.join(server_names)}\n"
-                f"ID: `{job_id}`",
-                parse_mode="Markdown"
-            )
-        except Exception as e:
-            logger.error(f"Failed to send start notification: {e}")
+        self._queue_notification(
+            chat_id,
+            f"🔄 *Запуск запланированного обновления*\n\n"
+            f"Серверы: {', '.join(server_names)}\n"
+            f"ID: `{job_id}`"
+        )
         
-        # Get server configs
-        all_servers = storage.get_all_servers()
-        servers = [s for s in all_servers if s.name in server_names]
+        # Get server configs (set-based filter over the cached list)
+        servers = storage.get_servers_by_names(server_names)
         
-        # Execute updates
-        results: list[UpdateResult] = []
-        for server in servers:
-            executor = SSHExecutor(server)
-            result = await executor.update_n8n()
-            results.append(result)
-            logger.info(f"Update result for {server.name}: {result.success}")
-            
-            # Save to history
-            storage.add_update_history(
-                server_id=server.id,
+        # Execute updates in parallel, bounded by the semaphore so one
+        # slow server doesn't serialize the rest. Exceptions become
+        # failed results so one crash can't lose the whole batch report
+        raw_results = await asyncio.gather(
+            *(self._update_single_server(server) for server in servers),
+            return_exceptions=True
+        )
+        results: list[UpdateResult] = [
+            r if not isinstance(r, BaseException) else UpdateResult(
                 server_name=server.name,
-                old_version=result.old_version or "",
-                new_version=result.new_version or "",
-                success=result.success,
-                message=result.message
+                server_id=server.id,
+                success=False,
+                old_version=None,
+                new_version=None,
+                message=f"Update failed: {r}"
+            )
+            for server, r in zip(servers, raw_results)
+        ]
+
+        # Save to history: one transaction for the whole batch
+        storage.add_update_history_bulk([
+            (
+                server.id,
+                server.name,
+                result.old_version or "",
+                result.new_version or "",
+                int(result.success),
+                result.message,
+                "",
             )
+            for server, result in zip(servers, results)
+        ])
         
         # Send results
         await self._send_update_results(chat_id, results)
+
+    async def _update_single_server(self, server: Server) -> UpdateResult:
+        """Update one server under the shared concurrency limit."""
+        async with _update_semaphore:
+            executor = SSHExecutor(server)
+            result = await executor.update_n8n()
+            logger.info(f"Update result for {server.name}: {result.success}")
+            return result
     
     async def _send_update_results(self, chat_id: int, results: list[UpdateResult]):
         """Send update results notification."""
@@ -282,16 +353,7 @@ class UpdateScheduler:
                     details = result.details[:200] + "..." if len(result.details) > 200 else result.details
                     lines.append(f"   └ {details}")
         
-        try:
-            from .bot.keyboards import get_main_menu
-            await self.bot.send_message(
-                chat_id,
-                "\n".join(lines),
-                parse_mode="Markdown",
-                reply_markup=get_main_menu(has_servers=True)
-            )
-        except Exception as e:
-            logger.error(f"Failed to send update results: {e}")
+        self._queue_notification(chat_id, "\n".join(lines))
     
     def cancel_update(self, job_id: str) -> bool:
         """
@@ -362,7 +424,7 @@ class UpdateScheduler:
         """Check health of all servers and notify on issues."""
         logger.info("Running server health check...")
         
-        storage = get_storage()
+        storage = self.storage
         admin_id = storage.get_admin_chat_id()
         
         if not admin_id:
@@ -419,25 +481,13 @@ class UpdateScheduler:
         """Send health alert notification."""
         lines = ["🚨 *Проблемы с серверами!*\n"]
         
-        for server in unhealthy_servers:
-            error = server.get("error_message", "Неизвестная ошибка")
-            failures = server.get("consecutive_failures", 0)
-            lines.append(
-                f"🔴 *{server['server_name']}*\n"
-                f"   └ {error}\n"
-                f"   └ Неудачных проверок: {failures}"
-            )
-        
+        lines.extend(
+            f"🔴 *{server['server_name']}*\n"
+            f"   └ {server.get('error_message', 'Неизвестная ошибка')}\n"
+            f"   └ Неудачных проверок: {server.get('consecutive_failures', 0)}"
+            for server in unhealthy_servers
+        )
         lines.append("\nИспользуй /status для деталей.")
         
-        try:
-            from .bot.keyboards import get_main_menu
-            await self.bot.send_message(
-                chat_id,
-                "\n".join(lines),
-                parse_mode="Markdown",
-                reply_markup=get_main_menu(has_servers=True)
-            )
-            logger.info(f"Health alert sent for {len(unhealthy_servers)} server(s)")
-        except Exception as e:
-            logger.error(f"Failed to send health alert: {e}")
\ No newline at end of file
+        self._queue_notification(chat_id, "\n".join(lines))
+        logger.info(f"Health alert queued for {len(unhealthy_servers)} server(s)")
\ No newline at end of file
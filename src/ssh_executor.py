@@ -2,7 +2,11 @@
 
 import asyncio
 import logging
+import os
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional, Callable, Awaitable
@@ -11,7 +15,7 @@ import aiohttp
 import paramiko
 
 from .storage import Server
-from .version_checker import parse_version
+from .version_checker import parse_version, get_http_session
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +23,43 @@ logger = logging.getLogger(__name__)
 # Progress callback type: async function(step: int, total: int, message: str)
 ProgressCallback = Callable[[int, int, str], Awaitable[None]]
 
+# Dedicated bounded pool for blocking paramiko calls. The loop's default
+# executor is shared with everything else and sized by CPU count; a fixed
+# pool caps how many SSH threads can pile up under fan-out and keeps them
+# out of the way of other run_in_executor users.
+_SSH_POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix="ssh")
+
+# Live SSH clients shared across executor instances, keyed by endpoint.
+# Status probes, health checks and update flows for the same server all
+# reuse one authenticated transport instead of paying a fresh handshake
+# each; paramiko multiplexes exec channels over it. Per-key locks keep
+# one handshake in flight per endpoint without serializing the fleet.
+_client_pool: dict[tuple[str, int, str], paramiko.SSHClient] = {}
+_pool_locks: dict[tuple[str, int, str], "threading.Lock"] = {}
+_pool_guard = threading.Lock()
+
+
+def _pool_lock(key: tuple[str, int, str]) -> "threading.Lock":
+    """Get (or create) the connect lock for one endpoint."""
+    with _pool_guard:
+        lock = _pool_locks.get(key)
+        if lock is None:
+            lock = threading.Lock()
+            _pool_locks[key] = lock
+        return lock
+
+
+def close_all_ssh_clients():
+    """Close every pooled SSH connection (called on shutdown)."""
+    with _pool_guard:
+        clients = list(_client_pool.values())
+        _client_pool.clear()
+    for client in clients:
+        try:
+            client.close()
+        except Exception:
+            pass
+
 
 @dataclass
 class CommandResult:
@@ -76,20 +117,39 @@ class SSHExecutor:
         self.server = server
         self._client: Optional[paramiko.SSHClient] = None
     
+    @property
+    def _pool_key(self) -> tuple[str, int, str]:
+        return (self.server.host, self.server.port, self.server.user)
+
     def _get_client(self) -> paramiko.SSHClient:
-        """Get or create SSH client connection."""
-        if self._client is not None:
-            # Check if connection is still alive
-            try:
-                transport = self._client.get_transport()
-                if transport and transport.is_active():
-                    return self._client
-            except Exception:
-                pass
-            
-            # Connection dead, close and reconnect
-            self._close()
-        
+        """Get a pooled SSH client connection, reconnecting if dead."""
+        key = self._pool_key
+        with _pool_lock(key):
+            client = _client_pool.get(key)
+            if client is not None:
+                # Check if connection is still alive
+                try:
+                    transport = client.get_transport()
+                    if transport and transport.is_active():
+                        self._client = client
+                        return client
+                except Exception:
+                    pass
+
+                # Connection dead, drop it and reconnect
+                _client_pool.pop(key, None)
+                try:
+                    client.close()
+                except Exception:
+                    pass
+
+            client = self._connect()
+            _client_pool[key] = client
+            self._client = client
+            return client
+
+    def _connect(self) -> paramiko.SSHClient:
+        """Open a fresh SSH connection for this server."""
         client = paramiko.SSHClient()
         client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
         
@@ -131,18 +191,37 @@ class SSHExecutor:
             raise ValueError(f"Invalid auth configuration for server {self.server.name}")
         
         client.connect(**connect_kwargs)
-        
-        self._client = client
+
+        # Let the transport ping idle connections so pooled clients
+        # survive NAT/firewall timeouts between flows
+        transport = client.get_transport()
+        if transport:
+            transport.set_keepalive(30)
+
         return client
-    
+
+    def _release(self):
+        """Drop this executor's reference, leaving the pooled transport alive.
+
+        Flows call this when they finish; the connection stays in the
+        pool for the next flow and is liveness-checked on reuse. _close
+        is reserved for connections known (or suspected) to be broken.
+        """
+        self._client = None
+
     def _close(self):
-        """Close SSH connection."""
-        if self._client:
-            try:
-                self._client.close()
-            except Exception:
-                pass
-            self._client = None
+        """Close this executor's SSH connection and evict it from the pool."""
+        client = self._client
+        self._client = None
+        if client is None:
+            return
+        with _pool_guard:
+            if _client_pool.get(self._pool_key) is client:
+                _client_pool.pop(self._pool_key, None)
+        try:
+            client.close()
+        except Exception:
+            pass
     
     async def execute(self, command: str, timeout: int = 300) -> CommandResult:
         """
@@ -180,7 +259,13 @@ class SSHExecutor:
         
         # Run in thread pool to not block async loop
         loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, _exec)
+        try:
+            return await loop.run_in_executor(_SSH_POOL, _exec)
+        except asyncio.CancelledError:
+            # Cancelled mid-command (e.g. bot shutdown): don't leave the
+            # SSH transport half-open behind the abandoned thread
+            self._close()
+            raise
     
     async def get_current_version(self) -> Optional[str]:
         """
@@ -468,12 +553,16 @@ class SSHExecutor:
                 can_rollback=bool(compose_backup_path)
             )
         finally:
-            self._close()
+            self._release()
     
     async def test_connection(self) -> tuple[bool, str]:
         """
         Test SSH connection to the server.
-        
+
+        Keeps the connection open on success so follow-up commands
+        (version check, container check) reuse the same handshake.
+        Callers are responsible for calling _release() when done.
+
         Returns:
             Tuple of (success, message).
         """
@@ -484,9 +573,8 @@ class SSHExecutor:
             else:
                 return False, f"Command failed: {result.stderr}"
         except Exception as e:
-            return False, f"Connection failed: {str(e)}"
-        finally:
             self._close()
+            return False, f"Connection failed: {str(e)}"
     
     async def rollback_n8n(
         self,
@@ -627,7 +715,7 @@ class SSHExecutor:
                 details="\n".join(details_parts)
             )
         finally:
-            self._close()
+            self._release()
 
 
 async def get_server_status(server: Server) -> dict:
@@ -685,7 +773,50 @@ async def get_server_status(server: Server) -> dict:
             "ui_healthy": False
         }
     finally:
-        executor._close()
+        executor._release()
+
+
+# Short-lived status cache: tapping "status" then "check updates" within
+# seconds shouldn't pay for two full SSH probe rounds per server.
+SERVER_STATUS_TTL = 10.0
+
+_status_cache: dict[int, tuple[float, dict]] = {}
+_status_inflight: dict[int, asyncio.Task] = {}
+
+# Bound on concurrent status probes: the status/check screens gather one
+# probe per server, and with many servers an unbounded fan-out saturates
+# the SSH thread pool with handshakes all at once.
+_probe_semaphore = asyncio.Semaphore(int(os.getenv("N8N_SSH_CONCURRENCY", "8")))
+
+
+async def cached_server_status(server: Server, ttl: float = SERVER_STATUS_TTL) -> dict:
+    """
+    Get server status, reusing a recent probe result if one exists.
+
+    Results are cached per server for `ttl` seconds, and concurrent
+    callers for the same server share a single in-flight probe instead
+    of opening parallel SSH sessions to the same host.
+    """
+    cached = _status_cache.get(server.id)
+    if cached and time.monotonic() - cached[0] < ttl:
+        return cached[1]
+
+    task = _status_inflight.get(server.id)
+    if task is None:
+        task = asyncio.create_task(_probe_server_status(server))
+        _status_inflight[server.id] = task
+    return await task
+
+
+async def _probe_server_status(server: Server) -> dict:
+    """Run a fresh status probe and store it in the cache."""
+    try:
+        async with _probe_semaphore:
+            status = await get_server_status(server)
+        _status_cache[server.id] = (time.monotonic(), status)
+        return status
+    finally:
+        _status_inflight.pop(server.id, None)
 
 
 @dataclass
@@ -719,23 +850,26 @@ async def check_n8n_health(url: str, timeout: int = 10) -> tuple[bool, Optional[
         
         # Try the healthz endpoint first, then fall back to root
         endpoints = ["/healthz", "/rest/health", "/"]
-        
-        async with aiohttp.ClientSession() as session:
-            for endpoint in endpoints:
-                try:
-                    check_url = url.rstrip("/") + endpoint
-                    async with session.get(
-                        check_url,
-                        timeout=aiohttp.ClientTimeout(total=timeout),
-                        ssl=False  # Allow self-signed certs
-                    ) as response:
-                        if response.status < 500:
-                            return True, None
-                except aiohttp.ClientError:
-                    continue
-            
-            return False, "All health endpoints failed"
-            
+
+        # Reuse the shared session: probes keep connections alive between
+        # monitoring cycles instead of paying DNS + TLS setup per call
+        session = await get_http_session()
+        for endpoint in endpoints:
+            try:
+                check_url = url.rstrip("/") + endpoint
+                async with session.get(
+                    check_url,
+                    timeout=aiohttp.ClientTimeout(total=timeout),
+                    ssl=False  # Allow self-signed certs
+                ) as response:
+                    if response.status < 500:
+                        return True, None
+            except aiohttp.ClientError:
+                continue
+
+        return False, "All health endpoints failed"
+
+
     except asyncio.TimeoutError:
         return False, "Connection timeout"
     except aiohttp.ClientError as e:
@@ -807,4 +941,4 @@ async def perform_full_health_check(server: Server) -> HealthCheckResult:
         result.error = str(e)
         return result
     finally:
-        executor._close()
+        executor._release()
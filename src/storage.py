@@ -3,6 +3,7 @@
 import json
 import logging
 import sqlite3
+import threading
 from contextlib import contextmanager
 from dataclasses import dataclass, asdict
 from datetime import datetime
@@ -50,6 +51,39 @@ class Server:
         )
 
 
+@dataclass(slots=True)
+class HealthRow:
+    """One server's cached health state (slotted: read often, per render)."""
+
+    server_id: int
+    server_name: str
+    is_healthy: bool
+    ssh_ok: bool
+    container_running: bool
+    ui_accessible: bool
+    version: Optional[str]
+    last_check: Optional[str]
+    last_healthy: Optional[str]
+    error_message: Optional[str]
+    consecutive_failures: int
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "HealthRow":
+        return cls(
+            server_id=row["server_id"],
+            server_name=row["server_name"],
+            is_healthy=bool(row["is_healthy"]),
+            ssh_ok=bool(row["ssh_ok"]),
+            container_running=bool(row["container_running"]),
+            ui_accessible=bool(row["ui_accessible"]),
+            version=row["version"],
+            last_check=row["last_check"],
+            last_healthy=row["last_healthy"],
+            error_message=row["error_message"],
+            consecutive_failures=row["consecutive_failures"] or 0,
+        )
+
+
 @dataclass
 class Settings:
     """Application settings."""
@@ -73,21 +107,42 @@ class Storage:
         
         self.db_path = db_path
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Single persistent connection: avoids open/close per call and,
+        # with WAL, keeps commits cheap enough to run on the event loop.
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA temp_store=MEMORY")
+        self._conn.execute("PRAGMA mmap_size=134217728")
+        self._lock = threading.Lock()
+
+        # In-process caches for small, rarely-changing data.
+        # Invalidated by the corresponding write methods.
+        self._servers_cache: Optional[list[Server]] = None
+        self._servers_by_id: Optional[dict[int, Server]] = None
+        self._server_names: Optional[frozenset[str]] = None
+        self._settings_cache: dict[str, Optional[str]] = {}
+        self._admin_chat_id: Optional[int] = None
+        self._admin_id_loaded = False
+
         self._init_db()
-    
+
     @contextmanager
     def _get_connection(self):
-        """Get database connection with row factory."""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        try:
-            yield conn
-            conn.commit()
-        except Exception:
-            conn.rollback()
-            raise
-        finally:
-            conn.close()
+        """Get the shared database connection (serialized via lock)."""
+        with self._lock:
+            try:
+                yield self._conn
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+
+    def close(self):
+        """Close the database connection."""
+        self._conn.close()
     
     def _init_db(self):
         """Initialize database schema."""
@@ -198,30 +253,47 @@ class Storage:
                 server.n8n_path,
                 server.n8n_url
             ))
+            self._invalidate_servers_cache()
             return cursor.lastrowid
     
+    def _invalidate_servers_cache(self):
+        """Drop the cached server views after a write."""
+        self._servers_cache = None
+        self._servers_by_id = None
+        self._server_names = None
+
     def get_server(self, server_id: int) -> Optional[Server]:
-        """Get server by ID."""
-        with self._get_connection() as conn:
-            row = conn.execute(
-                "SELECT * FROM servers WHERE id = ?", (server_id,)
-            ).fetchone()
-            return Server.from_row(row) if row else None
-    
+        """Get server by ID (O(1) via the cached id map)."""
+        if self._servers_by_id is None:
+            self._servers_by_id = {s.id: s for s in self.get_all_servers()}
+        return self._servers_by_id.get(server_id)
+
     def get_server_by_name(self, name: str) -> Optional[Server]:
-        """Get server by name."""
-        with self._get_connection() as conn:
-            row = conn.execute(
-                "SELECT * FROM servers WHERE name = ?", (name,)
-            ).fetchone()
-            return Server.from_row(row) if row else None
+        """Get server by name (served from the cached list)."""
+        for server in self.get_all_servers():
+            if server.name == name:
+                return server
+        return None
     
     def get_all_servers(self) -> list[Server]:
-        """Get all servers."""
-        with self._get_connection() as conn:
-            rows = conn.execute("SELECT * FROM servers ORDER BY name").fetchall()
-            return [Server.from_row(row) for row in rows]
-    
+        """Get all servers (cached until the next write)."""
+        if self._servers_cache is None:
+            with self._get_connection() as conn:
+                rows = conn.execute("SELECT * FROM servers ORDER BY name").fetchall()
+                self._servers_cache = [Server.from_row(row) for row in rows]
+        return self._servers_cache
+    
+    def get_server_names(self) -> frozenset[str]:
+        """Get all server names (cached until the next write)."""
+        if self._server_names is None:
+            self._server_names = frozenset(s.name for s in self.get_all_servers())
+        return self._server_names
+
+    def get_servers_by_names(self, names) -> list[Server]:
+        """Get servers matching the given names, in name order."""
+        wanted = frozenset(names)
+        return [s for s in self.get_all_servers() if s.name in wanted]
+
     def update_server(self, server: Server) -> bool:
         """Update server configuration."""
         if server.id is None:
@@ -245,6 +317,7 @@ class Storage:
                 server.n8n_url,
                 server.id
             ))
+            self._invalidate_servers_cache()
             return True
     
     def update_server_url(self, server_id: int, n8n_url: str) -> bool:
@@ -254,30 +327,34 @@ class Storage:
                 "UPDATE servers SET n8n_url = ? WHERE id = ?",
                 (n8n_url, server_id)
             )
+            self._invalidate_servers_cache()
             return cursor.rowcount > 0
     
     def delete_server(self, server_id: int) -> bool:
         """Delete server by ID."""
         with self._get_connection() as conn:
             cursor = conn.execute("DELETE FROM servers WHERE id = ?", (server_id,))
+            self._invalidate_servers_cache()
             return cursor.rowcount > 0
     
     def server_count(self) -> int:
         """Get number of servers."""
-        with self._get_connection() as conn:
-            row = conn.execute("SELECT COUNT(*) FROM servers").fetchone()
-            return row[0]
+        # Rides the cached list: no COUNT(*) on the per-message hot path
+        return len(self.get_all_servers())
     
     # ============= Settings Management =============
     
     def get_setting(self, key: str, default: str = None) -> Optional[str]:
-        """Get a setting value."""
-        with self._get_connection() as conn:
-            row = conn.execute(
-                "SELECT value FROM settings WHERE key = ?", (key,)
-            ).fetchone()
-            return row["value"] if row else default
-    
+        """Get a setting value (cached; all writes go through set_setting)."""
+        if key not in self._settings_cache:
+            with self._get_connection() as conn:
+                row = conn.execute(
+                    "SELECT value FROM settings WHERE key = ?", (key,)
+                ).fetchone()
+                self._settings_cache[key] = row["value"] if row else None
+        value = self._settings_cache[key]
+        return value if value is not None else default
+
     def set_setting(self, key: str, value: str):
         """Set a setting value."""
         with self._get_connection() as conn:
@@ -285,15 +362,21 @@ class Storage:
                 INSERT INTO settings (key, value) VALUES (?, ?)
                 ON CONFLICT(key) DO UPDATE SET value = excluded.value
             """, (key, value))
+            self._settings_cache[key] = value
     
     def get_admin_chat_id(self) -> Optional[int]:
-        """Get admin chat ID."""
-        value = self.get_setting("admin_chat_id")
-        return int(value) if value else None
-    
+        """Get admin chat ID (parsed once, then served from memory)."""
+        if not self._admin_id_loaded:
+            value = self.get_setting("admin_chat_id")
+            self._admin_chat_id = int(value) if value else None
+            self._admin_id_loaded = True
+        return self._admin_chat_id
+
     def set_admin_chat_id(self, chat_id: int):
         """Set admin chat ID."""
         self.set_setting("admin_chat_id", str(chat_id))
+        self._admin_chat_id = chat_id
+        self._admin_id_loaded = True
     
     def get_check_interval(self) -> int:
         """Get check interval in hours."""
@@ -339,25 +422,92 @@ class Storage:
                 (server_id, server_name, old_version, new_version, success, message, details)
                 VALUES (?, ?, ?, ?, ?, ?, ?)
             """, (server_id, server_name, old_version, new_version, int(success), message, details))
-    
-    def get_update_history(self, limit: int = 20, server_id: int = None) -> list[dict]:
+
+    def add_update_history_bulk(self, rows: list[tuple]):
+        """Record several update attempts with one commit.
+
+        Rows are (server_id, server_name, old_version, new_version,
+        success, message, details) tuples.
+        """
+        with self._get_connection() as conn:
+            conn.executemany("""
+                INSERT INTO update_history
+                (server_id, server_name, old_version, new_version, success, message, details)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+
+    def record_update_result(
+        self,
+        server_id: int,
+        server_name: str,
+        old_version: str,
+        new_version: str,
+        success: bool,
+        message: str,
+        details: str = "",
+        compose_backup_path: Optional[str] = None,
+        data_backup_path: Optional[str] = None,
+        keep_backups: int = 3
+    ) -> Optional[int]:
+        """Record one server's update outcome in a single transaction.
+
+        Saves the backup row (when a backup was taken), prunes old
+        backups and appends the history entry under one commit instead
+        of three. Returns the new backup id, or None without a backup.
+        """
+        backup_id = None
+        with self._get_connection() as conn:
+            if compose_backup_path:
+                cursor = conn.execute("""
+                    INSERT INTO backups
+                    (server_id, server_name, compose_backup_path, data_backup_path, old_version)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (server_id, server_name, compose_backup_path, data_backup_path, old_version))
+                backup_id = cursor.lastrowid
+                conn.execute("""
+                    DELETE FROM backups
+                    WHERE server_id = ? AND id NOT IN (
+                        SELECT id FROM backups
+                        WHERE server_id = ?
+                        ORDER BY created_at DESC
+                        LIMIT ?
+                    )
+                """, (server_id, server_id, keep_backups))
+            conn.execute("""
+                INSERT INTO update_history
+                (server_id, server_name, old_version, new_version, success, message, details)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (server_id, server_name, old_version, new_version, int(success), message, details))
+        return backup_id
+
+    def get_update_history(self, limit: int = 20, server_id: int = None, offset: int = 0) -> list[dict]:
         """Get recent update history."""
+        # created_at_display is computed in SQL (minute precision, no "T")
+        # so render paths don't re-slice the timestamp per row in Python
         with self._get_connection() as conn:
             if server_id:
                 rows = conn.execute("""
-                    SELECT * FROM update_history 
+                    SELECT *, replace(substr(created_at, 1, 16), 'T', ' ') AS created_at_display
+                    FROM update_history
                     WHERE server_id = ?
-                    ORDER BY created_at DESC 
-                    LIMIT ?
-                """, (server_id, limit)).fetchall()
+                    ORDER BY created_at DESC
+                    LIMIT ? OFFSET ?
+                """, (server_id, limit, offset)).fetchall()
             else:
                 rows = conn.execute("""
-                    SELECT * FROM update_history 
-                    ORDER BY created_at DESC 
-                    LIMIT ?
-                """, (limit,)).fetchall()
+                    SELECT *, replace(substr(created_at, 1, 16), 'T', ' ') AS created_at_display
+                    FROM update_history
+                    ORDER BY created_at DESC
+                    LIMIT ? OFFSET ?
+                """, (limit, offset)).fetchall()
             return [dict(row) for row in rows]
     
+    def get_max_history_id(self) -> int:
+        """Get the newest update_history row id (0 when empty)."""
+        with self._get_connection() as conn:
+            row = conn.execute("SELECT MAX(id) FROM update_history").fetchone()
+            return row[0] or 0
+
     def get_update_history_entry(self, entry_id: int) -> Optional[dict]:
         """Get a specific update history entry."""
         with self._get_connection() as conn:
@@ -381,41 +531,93 @@ class Storage:
     ):
         """Update server health status with detailed check results."""
         with self._get_connection() as conn:
-            now = datetime.now().isoformat()
-            
-            # Get current state
-            row = conn.execute(
-                "SELECT * FROM server_health WHERE server_id = ?", (server_id,)
-            ).fetchone()
-            
-            if row:
-                if is_healthy:
-                    conn.execute("""
-                        UPDATE server_health 
-                        SET is_healthy = 1, ssh_ok = ?, container_running = ?, 
-                            ui_accessible = ?, version = ?, last_check = ?, last_healthy = ?,
-                            error_message = NULL, consecutive_failures = 0, notified = 0
-                        WHERE server_id = ?
-                    """, (int(ssh_ok), int(container_running), int(ui_accessible), version, now, now, server_id))
-                else:
-                    consecutive = row["consecutive_failures"] + 1
-                    conn.execute("""
-                        UPDATE server_health 
-                        SET is_healthy = 0, ssh_ok = ?, container_running = ?,
-                            ui_accessible = ?, version = ?, last_check = ?, error_message = ?,
-                            consecutive_failures = ?
-                        WHERE server_id = ?
-                    """, (int(ssh_ok), int(container_running), int(ui_accessible), version, now, error_message, consecutive, server_id))
+            self._write_server_health(
+                conn, datetime.now().isoformat(),
+                server_id=server_id,
+                server_name=server_name,
+                is_healthy=is_healthy,
+                error_message=error_message,
+                ssh_ok=ssh_ok,
+                container_running=container_running,
+                ui_accessible=ui_accessible,
+                version=version
+            )
+
+    def update_server_health_bulk(self, rows: list[dict], settings: dict[str, str] = None):
+        """
+        Write many health results (and optional settings) in one transaction.
+
+        Args:
+            rows: Keyword dicts matching update_server_health's signature.
+            settings: Extra key/value settings to persist in the same commit.
+        """
+        now = datetime.now().isoformat()
+        with self._get_connection() as conn:
+            for row in rows:
+                self._write_server_health(conn, now, **row)
+            if settings:
+                self._write_settings(conn, settings)
+
+    def set_settings_bulk(self, values: dict):
+        """Write several settings atomically in one transaction."""
+        with self._get_connection() as conn:
+            self._write_settings(conn, values)
+
+    def _write_settings(self, conn, values: dict):
+        """Upsert settings rows inside the caller's transaction."""
+        conn.executemany("""
+            INSERT INTO settings (key, value) VALUES (?, ?)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value
+        """, list(values.items()))
+        self._settings_cache.update(values)
+
+    def _write_server_health(
+        self,
+        conn,
+        now: str,
+        server_id: int,
+        server_name: str,
+        is_healthy: bool,
+        error_message: str = None,
+        ssh_ok: bool = False,
+        container_running: bool = False,
+        ui_accessible: bool = False,
+        version: str = None
+    ):
+        """Write one health row inside the caller's transaction."""
+        # Get current state
+        row = conn.execute(
+            "SELECT * FROM server_health WHERE server_id = ?", (server_id,)
+        ).fetchone()
+
+        if row:
+            if is_healthy:
+                conn.execute("""
+                    UPDATE server_health
+                    SET is_healthy = 1, ssh_ok = ?, container_running = ?,
+                        ui_accessible = ?, version = ?, last_check = ?, last_healthy = ?,
+                        error_message = NULL, consecutive_failures = 0, notified = 0
+                    WHERE server_id = ?
+                """, (int(ssh_ok), int(container_running), int(ui_accessible), version, now, now, server_id))
             else:
-                # Insert new record
-                last_healthy = now if is_healthy else None
+                consecutive = row["consecutive_failures"] + 1
                 conn.execute("""
-                    INSERT INTO server_health 
-                    (server_id, server_name, is_healthy, ssh_ok, container_running, ui_accessible, 
-                     version, last_check, last_healthy, error_message, consecutive_failures)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (server_id, server_name, int(is_healthy), int(ssh_ok), int(container_running), 
-                      int(ui_accessible), version, now, last_healthy, error_message, 0 if is_healthy else 1))
+                    UPDATE server_health
+                    SET is_healthy = 0, ssh_ok = ?, container_running = ?,
+                        ui_accessible = ?, version = ?, last_check = ?, error_message = ?,
+                        consecutive_failures = ?
+                    WHERE server_id = ?
+                """, (int(ssh_ok), int(container_running), int(ui_accessible), version, now, error_message, consecutive, server_id))
+        else:
+            # Insert new record
+            last_healthy = now if is_healthy else None
+            conn.execute("""
+                INSERT INTO server_health
+                (server_id, server_name, is_healthy, ssh_ok, container_running, ui_accessible,
+                 version, last_check, last_healthy, error_message, consecutive_failures)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (server_id, server_name, int(is_healthy), int(ssh_ok), int(container_running),
+                  int(ui_accessible), version, now, last_healthy, error_message, 0 if is_healthy else 1))
     
     def get_server_health(self, server_id: int) -> Optional[dict]:
         """Get health status for a server."""
@@ -425,13 +627,11 @@ class Storage:
             ).fetchone()
             return dict(row) if row else None
     
-    def get_all_server_health(self) -> list[dict]:
-        """Get health status for all servers."""
+    def get_all_server_health(self) -> dict[int, HealthRow]:
+        """Get health status for all servers, keyed by server id."""
         with self._get_connection() as conn:
-            rows = conn.execute(
-                "SELECT * FROM server_health ORDER BY server_name"
-            ).fetchall()
-            return [dict(row) for row in rows]
+            rows = conn.execute("SELECT * FROM server_health").fetchall()
+            return {row["server_id"]: HealthRow.from_row(row) for row in rows}
     
     def get_unhealthy_servers_for_notification(self, min_failures: int = 2) -> list[dict]:
         """Get unhealthy servers that need notification."""
@@ -1,6 +1,9 @@
 """Version checker for n8n using Docker Hub API."""
 
+import asyncio
+import functools
 import re
+import time
 import logging
 from dataclasses import dataclass
 from typing import Optional
@@ -16,6 +19,46 @@ N8N_IMAGE = "n8nio/n8n"
 # Regex for semantic versioning (e.g., 1.70.0, 1.70.1)
 SEMVER_PATTERN = re.compile(r"^(\d+)\.(\d+)\.(\d+)$")
 
+# Shared HTTP session: one TLS handshake and DNS lookup per bot lifetime
+# instead of per check, with connection keep-alive between calls.
+_session: Optional[aiohttp.ClientSession] = None
+
+
+async def get_http_session() -> aiohttp.ClientSession:
+    """Get the shared HTTP session (created lazily)."""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=32, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=30)
+        )
+    return _session
+
+
+async def close_http_session():
+    """Close the shared HTTP session (called on shutdown)."""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+# The latest n8n version is a global fact that changes a few times a day:
+# cache it so status/update checks cost a dict lookup instead of an
+# upstream request. Within the stale-while-revalidate window an expired
+# entry is still served while a background task fetches a fresh one, so
+# users never wait on the network once the cache is warm.
+LATEST_VERSION_TTL = 3600.0
+LATEST_VERSION_SWR = 600.0
+# Floor applied even to force_refresh callers: the startup check and a
+# user-triggered /check landing within a minute of each other should
+# share one upstream request, not race two.
+LATEST_VERSION_MIN_REFRESH = 60.0
+
+_latest_cached: Optional["VersionInfo"] = None
+_latest_fetched_at: float = 0.0
+_latest_lock: Optional[asyncio.Lock] = None
+
 
 @dataclass
 class VersionInfo:
@@ -70,15 +113,15 @@ async def get_latest_version() -> Optional[VersionInfo]:
         VersionInfo for the latest stable version, or None if fetch failed.
     """
     try:
-        async with aiohttp.ClientSession() as session:
-            # Fetch tags including 'latest'
-            params = {"page_size": 100}
-            async with session.get(DOCKER_HUB_API, params=params) as response:
-                if response.status != 200:
-                    logger.error(f"Docker Hub API returned {response.status}")
-                    return None
-                
-                data = await response.json()
+        session = await get_http_session()
+        # Fetch tags including 'latest'
+        params = {"page_size": 100}
+        async with session.get(DOCKER_HUB_API, params=params) as response:
+            if response.status != 200:
+                logger.error(f"Docker Hub API returned {response.status}")
+                return None
+
+            data = await response.json()
         
         # Find the 'latest' tag and its digest
         latest_digest = None
@@ -131,6 +174,92 @@ async def get_latest_version() -> Optional[VersionInfo]:
         return None
 
 
+async def cached_latest_version(force_refresh: bool = False) -> Optional[VersionInfo]:
+    """
+    Get the latest n8n version, served from a TTL cache.
+
+    Fresh entries (younger than LATEST_VERSION_TTL) are returned directly.
+    Entries expired by less than LATEST_VERSION_SWR are returned as-is
+    while a background task revalidates, so the caller never blocks on
+    the network. Only a cold or long-expired cache awaits a live fetch;
+    concurrent callers then share a single request behind the lock.
+    Failed fetches are not cached, so the next call retries.
+
+    Args:
+        force_refresh: Fetch fresh even if the TTL has not expired (used
+            by the scheduler's periodic check to keep the cache warm).
+            Entries younger than LATEST_VERSION_MIN_REFRESH are still
+            served from cache so bursty checks coalesce.
+
+    Returns:
+        VersionInfo for the latest stable version, or None if fetch failed.
+    """
+    global _latest_cached, _latest_fetched_at, _latest_lock
+
+    if _latest_lock is None:
+        _latest_lock = asyncio.Lock()
+
+    # Even forced refreshes honour a short floor so bursts (initial
+    # check firing next to a user-triggered one) share a single fetch
+    max_age = LATEST_VERSION_MIN_REFRESH if force_refresh else LATEST_VERSION_TTL
+
+    if _latest_cached is not None:
+        age = time.monotonic() - _latest_fetched_at
+        if age < max_age:
+            return _latest_cached
+        if not force_refresh and age < LATEST_VERSION_TTL + LATEST_VERSION_SWR:
+            # Serve stale, revalidate in the background. The lock check
+            # keeps a burst of callers from spawning duplicate refreshes.
+            if not _latest_lock.locked():
+                asyncio.create_task(_refresh_latest_version())
+            return _latest_cached
+
+    async with _latest_lock:
+        # Another caller may have refreshed while we waited for the lock
+        if _latest_cached is not None:
+            if time.monotonic() - _latest_fetched_at < max_age:
+                return _latest_cached
+
+        latest = await get_latest_version()
+        if latest is not None:
+            _latest_cached = latest
+            _latest_fetched_at = time.monotonic()
+        return latest
+
+
+def seed_latest_version(version_str: str):
+    """
+    Warm the latest-version cache from a persisted value at startup.
+
+    The seed is stored as already expired (but inside the
+    stale-while-revalidate window), so the first status render serves it
+    instantly while a background fetch replaces it with live data.
+    """
+    global _latest_cached, _latest_fetched_at
+
+    if _latest_cached is not None:
+        return
+    seeded = parse_version(version_str)
+    if seeded is not None:
+        _latest_cached = seeded
+        _latest_fetched_at = time.monotonic() - LATEST_VERSION_TTL
+        logger.info(f"Seeded latest-version cache with {seeded} from storage")
+
+
+async def _refresh_latest_version():
+    """Background revalidation for the stale-while-revalidate window."""
+    global _latest_cached, _latest_fetched_at
+
+    async with _latest_lock:
+        if time.monotonic() - _latest_fetched_at < LATEST_VERSION_TTL:
+            return  # Someone else refreshed while we waited
+
+        latest = await get_latest_version()
+        if latest is not None:
+            _latest_cached = latest
+            _latest_fetched_at = time.monotonic()
+
+
 async def get_all_versions(limit: int = 20) -> list[VersionInfo]:
     """
     Get recent n8n versions from Docker Hub.
@@ -142,14 +271,14 @@ async def get_all_versions(limit: int = 20) -> list[VersionInfo]:
         List of VersionInfo sorted by version descending.
     """
     try:
-        async with aiohttp.ClientSession() as session:
-            params = {"page_size": 100}
-            async with session.get(DOCKER_HUB_API, params=params) as response:
-                if response.status != 200:
-                    logger.error(f"Docker Hub API returned {response.status}")
-                    return []
-                
-                data = await response.json()
+        session = await get_http_session()
+        params = {"page_size": 100}
+        async with session.get(DOCKER_HUB_API, params=params) as response:
+            if response.status != 200:
+                logger.error(f"Docker Hub API returned {response.status}")
+                return []
+
+            data = await response.json()
         
         versions: list[VersionInfo] = []
         
@@ -172,6 +301,7 @@ async def get_all_versions(limit: int = 20) -> list[VersionInfo]:
         return []
 
 
+@functools.lru_cache(maxsize=256)
 def parse_version(version_str: str) -> Optional[VersionInfo]:
     """
     Parse a version string into VersionInfo.
@@ -243,18 +373,18 @@ async def get_release_changelog(version: str, max_length: int = 1500) -> Optiona
     url = f"{GITHUB_RELEASES_API}/{tag}"
     
     try:
-        async with aiohttp.ClientSession() as session:
-            headers = {"Accept": "application/vnd.github.v3+json"}
-            async with session.get(url, headers=headers) as response:
-                if response.status == 404:
-                    logger.debug(f"Release not found for tag {tag}")
-                    return None
-                    
-                if response.status != 200:
-                    logger.error(f"GitHub API returned {response.status}")
-                    return None
-                
-                data = await response.json()
+        session = await get_http_session()
+        headers = {"Accept": "application/vnd.github.v3+json"}
+        async with session.get(url, headers=headers) as response:
+            if response.status == 404:
+                logger.debug(f"Release not found for tag {tag}")
+                return None
+
+            if response.status != 200:
+                logger.error(f"GitHub API returned {response.status}")
+                return None
+
+            data = await response.json()
         
         body = data.get("body", "")
         